@@ -118,6 +118,7 @@ class ProjectAdmin(admin.ModelAdmin):
                     "description",
                     "secret_key",
                     "allow_any_domains",
+                    "ws_settings",
                     ("created_at", "updated_at"),
                 )
             else:
@@ -129,6 +130,7 @@ class ProjectAdmin(admin.ModelAdmin):
                     "description",
                     "secret_key",
                     "allow_any_domains",
+                    "ws_settings",
                     ("created_at", "updated_at"),
                 )
             else:
@@ -5,3 +5,6 @@ class SrcConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "src"
     verbose_name = "Services"
+
+    def ready(self):
+        from src import signals  # noqa: F401
@@ -11,11 +11,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
 application = get_asgi_application()
 
 from src.ws import routing  # noqa: E402
+from src.ws.drain import drainer  # noqa: E402
+from src.ws.health import HealthCheckMiddleware  # noqa: E402
+
+drainer.install()  # SIGUSR1 starts the drain mode
 
 
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
+        "http": HealthCheckMiddleware(get_asgi_application()),
         "websocket": AllowedHostsOriginValidator(
             AuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
         ),
@@ -6,7 +6,12 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinLengthValidator
 
 from src.models import Domain, Project, User
-from src.funks import validate_domain, validate_project_name, validate_username
+from src.funks import (
+    validate_domain,
+    validate_project_name,
+    validate_username,
+    validate_ws_settings,
+)
 
 
 class RegistrationForm(forms.Form):
@@ -104,16 +109,18 @@ class DomainForm(ModelForm):
 class ProjectForm(ModelForm):
     class Meta:
         model = Project
-        fields = ("name", "description", "allow_any_domains")
+        fields = ("name", "description", "allow_any_domains", "ws_settings")
         labels = {
             "name": "Project Name",
             "description": "Description",
             "allow_any_domains": "Allow any domains?",
+            "ws_settings": "WebSocket Settings",
         }
         help_texts = {
             "name": "Enter project name",
             "description": "Enter project description",
             "allow_any_domains": "Allow any domains, but still exclude blacklisted domains.",
+            "ws_settings": 'Overrides of the WebSocket settings, e.g. {"connect_rate": 50}',
         }
         error_messages = {
             "name": {
@@ -133,22 +140,32 @@ class ProjectForm(ModelForm):
 
         return name
 
+    def clean_ws_settings(self):
+        ws_settings = self.cleaned_data.get("ws_settings")
+        ws_settings, error = validate_ws_settings(ws_settings)
+        if error:
+            self.add_error("ws_settings", error)
+
+        return ws_settings
+
 
 class ProjectFormSuperUser(ModelForm):
     class Meta:
         model = Project
-        fields = ("name", "description", "allow_any_domains")
+        fields = ("name", "description", "allow_any_domains", "ws_settings")
         labels = {
             "name": "Project Name",
             "description": "Description",
             "allow_any_domains": "Allow any domains?",
             "owner": "Owner",
+            "ws_settings": "WebSocket Settings",
         }
         help_texts = {
             "name": "Enter project name",
             "description": "Enter project description",
             "allow_any_domains": "Allow any domains to access this project",
             "owner": "Select project owner",
+            "ws_settings": 'Overrides of the WebSocket settings, e.g. {"connect_rate": 50}',
         }
         widgets = {
             "name": forms.TextInput(attrs={"autofocus": True, "inputmode": "text"}),
@@ -163,6 +180,14 @@ class ProjectFormSuperUser(ModelForm):
 
         return name
 
+    def clean_ws_settings(self):
+        ws_settings = self.cleaned_data.get("ws_settings")
+        ws_settings, error = validate_ws_settings(ws_settings)
+        if error:
+            self.add_error("ws_settings", error)
+
+        return ws_settings
+
 
 class ProjectAddFormSuperUser(ProjectFormSuperUser):
     class Meta(ProjectFormSuperUser.Meta):
@@ -3,6 +3,7 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from django.urls import reverse
 from django.core.cache import cache
+from django.conf import settings
 
 import re
 from datetime import timedelta
@@ -44,6 +45,51 @@ def validate_domain(domain: str) -> tuple[str, str]:
         return domain, "E.g. example.com, sub.example.com, *.example.com, *.com or localhost"
 
 
+# Inclusive bounds of the WebSocket settings that are not just non-negative numbers:
+# sizes, windows and timeouts that cannot be 0
+WS_SETTINGS_RANGES = {
+    "connect_burst": (1, float("inf")),
+    "compression_level": (0, 9),
+    "compression_window_bits": (9, 15),
+    "compression_mem_level": (1, 9),
+    "batch_max_messages": (1, float("inf")),
+    "send_queue_size": (1, float("inf")),
+    "replay_max_age": (1, float("inf")),
+    "ack_window": (1, float("inf")),
+    "ack_timeout": (1, float("inf")),
+    "ack_retention": (1, float("inf")),
+    "mailbox_ttl": (1, float("inf")),
+    "heartbeat_max_missed": (1, float("inf")),
+}
+
+# Allowed values of the WebSocket settings that are strings
+WS_SETTINGS_CHOICES = {
+    "send_queue_overflow": ("drop_oldest", "drop_newest", "disconnect"),
+    "presence_counting": ("exact", "approximate"),
+}
+
+
+def validate_ws_settings(ws_settings) -> tuple[dict, str]:
+    if not isinstance(ws_settings, dict):
+        return ws_settings, 'Must be a JSON object, e.g. {"connect_rate": 50}'
+    for key, value in ws_settings.items():
+        if key not in settings.WS_PROJECT_DEFAULTS:
+            return ws_settings, f"Unknown setting: {key}"
+        default = settings.WS_PROJECT_DEFAULTS[key]
+        if key in WS_SETTINGS_CHOICES:
+            valid = value in WS_SETTINGS_CHOICES[key]
+        elif isinstance(default, bool) or not isinstance(default, (int, float)):
+            valid = isinstance(value, type(default))
+        else:
+            # integers stay integers: sizes, zlib levels and Redis TTLs reject floats
+            types = (int,) if type(default) is int else (int, float)
+            low, high = WS_SETTINGS_RANGES.get(key, (0, float("inf")))
+            valid = type(value) in types and low <= value <= high
+        if not valid:
+            return ws_settings, f"Invalid value of {key}: {value}"
+    return ws_settings, None
+
+
 def validate_project_name(name: str) -> tuple[str, str]:
     if re.match(r"^[a-zA-Z0-9-_]+$", name):
         return name.lower(), None
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from src.ws.compression import DeflateCompressor
+
+import json
+import random
+import time
+
+
+def typical_message(size):
+    # chat-like JSON: the same keys over and over, a little free text
+    words = ["hello", "world", "status", "online", "message", "update", "user", "room"]
+    items = []
+    while len(json.dumps(items)) < size:
+        items.append(
+            {
+                "sender": f"user-{random.randint(1, 50)}",
+                "type": random.choice(["chat", "typing", "presence"]),
+                "text": " ".join(random.choices(words, k=random.randint(2, 8))),
+                "ts": 1700000000 + random.randint(0, 100000),
+            }
+        )
+    return json.dumps({"sender": "bench", "message": items}).encode("utf-8")
+
+
+class Command(BaseCommand):
+    help = "Benchmark bytes saved against CPU spent by the +deflate codec on typical messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024, 4096, 16384])
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--level", type=int, default=6)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        self.stdout.write(
+            f"{'size':>7} {'takeover':>9} {'ratio':>7} {'saved/msg':>10} "
+            f"{'us/msg':>8} {'memory':>9}"
+        )
+        for size in options["sizes"]:
+            messages = [typical_message(size) for _ in range(options["messages"])]
+            raw = sum(len(message) for message in messages)
+            for takeover in (True, False):
+                compressor = DeflateCompressor(
+                    threshold=0,
+                    level=options["level"],
+                    server_context_takeover=takeover,
+                    client_context_takeover=takeover,
+                )
+                start = time.process_time()
+                compressed = sum(len(compressor.compress(message)) for message in messages)
+                elapsed = time.process_time() - start
+                self.stdout.write(
+                    " ".join(
+                        (
+                            f"{raw // len(messages):>7}",
+                            f"{'yes' if takeover else 'no':>9}",
+                            f"{compressed / raw:>7.2f}",
+                            f"{(raw - compressed) // len(messages):>10}",
+                            f"{elapsed / len(messages) * 1e6:>8.1f}",
+                            f"{compressor.memory():>9}",
+                        )
+                    )
+                )
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from src.matcher import DomainMatcher
+
+import random
+import re
+import string
+import timeit
+
+
+def random_label(length=8):
+    return "".join(random.choices(string.ascii_lowercase, k=length))
+
+
+def legacy_check(blacklist, whitelist, allow_any_domains, domain):
+    # Project.check_domain_allowed before the matcher, without the database queries
+    blacklist = [re.escape(item).replace(r"\*", r"[a-zA-Z0-9.-]*") for item in blacklist]
+    not_in_blacklist = not any(re.match(item, domain) for item in blacklist)
+    return not_in_blacklist and (domain in whitelist or allow_any_domains)
+
+
+class Command(BaseCommand):
+    help = "Benchmark domain whitelist/blacklist lookups as the number of rules grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+        parser.add_argument("--lookups", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'rules':>8} {'matcher (us)':>14} {'legacy (us)':>14} {'build (ms)':>12}"
+        )
+        for size in options["sizes"]:
+            random.seed(size)
+            blacklist = [f"*.{random_label()}.com" for _ in range(size // 2)]
+            whitelist = {f"{random_label()}.example.com" for _ in range(size - size // 2)}
+            rules = [(domain, "blacklist") for domain in blacklist]
+            rules += [(domain, "whitelist") for domain in whitelist]
+            hosts = random.sample(sorted(whitelist), min(len(whitelist), 50))
+            blacklisted = random.sample(blacklist, min(len(blacklist), 25))
+            hosts += [f"www.{domain[2:]}" for domain in blacklisted]
+            hosts += [f"{random_label()}.unknown.net" for _ in range(25)]
+
+            start = timeit.default_timer()
+            matcher = DomainMatcher(rules, allow_any_domains=True)
+            build = timeit.default_timer() - start
+
+            lookups = options["lookups"]
+            matcher_number = max(1, lookups // len(hosts))
+            matcher_time = timeit.timeit(
+                lambda: [matcher.is_allowed(host) for host in hosts], number=matcher_number
+            )
+            legacy_number = max(1, lookups // len(hosts) // max(1, size // 100))
+            legacy_time = timeit.timeit(
+                lambda: [legacy_check(blacklist, whitelist, True, host) for host in hosts],
+                number=legacy_number,
+            )
+            self.stdout.write(
+                " ".join(
+                    (
+                        f"{size:>8}",
+                        f"{matcher_time / (matcher_number * len(hosts)) * 1e6:>14.2f}",
+                        f"{legacy_time / (legacy_number * len(hosts)) * 1e6:>14.2f}",
+                        f"{build * 1e3:>12.2f}",
+                    )
+                )
+            )
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from channels.layers import get_channel_layer
+
+from src.ws.connection import get_redis
+from src.ws.presence import presence
+from src.ws.publish import message_event
+from src.ws.shards import channel_layer_alias, redis_url
+
+import asyncio
+import secrets
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark sending one message to many receivers: "
+        "a send per channel (the old loop) against ChannelLayer.send_to_clients. "
+        "Needs the Redis of CHANNEL_LAYERS, do not run it against one in use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receivers", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--workers", type=int, default=8, help="Processes receivers are on")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        layer = get_channel_layer(channel_layer_alias("bench"))
+        prefixes = [secrets.token_hex(6) for _ in range(options["workers"])]
+        channel_keys = [f"{layer.prefix}specific.{prefix}!" for prefix in prefixes]
+        url = redis_url("bench")
+        event = message_event({"sender": "bench", "message": "x" * 100})
+        self.stdout.write(
+            f"{'receivers':>10} {'loop (ms)':>12} {'batch (ms)':>12} {'speedup':>8}"
+        )
+
+        for count in options["receivers"]:
+            # receivers share the Redis key of their process, do not hit its capacity
+            layer.capacity = max(layer.capacity, count + 1)
+            clients = {}
+            for i in range(count):
+                prefix = prefixes[i % len(prefixes)]
+                clients[f"bench_{i}"] = f"specific.{prefix}!{secrets.token_hex(6)}"
+            for client_id, channel_name in clients.items():
+                await presence.register(client_id, channel_name, "bench")
+
+            async def loop():
+                for client_id in clients:
+                    for channel_name in await presence.resolve(client_id, url):
+                        await layer.send(channel_name, event)
+
+            async def batch():
+                await layer.send_to_clients(list(clients), event)
+
+            timings = []
+            for send in (loop, batch):
+                elapsed = 0
+                for _ in range(options["repeat"]):
+                    presence._cache.clear()  # both pay for resolving the receivers
+                    start = time.perf_counter()
+                    await send()
+                    elapsed += time.perf_counter() - start
+                    await get_redis(url).delete(*channel_keys)
+                timings.append(elapsed / options["repeat"] * 1e3)
+
+            for client_id, channel_name in clients.items():
+                await presence.unregister(client_id, channel_name, "bench")
+            self.stdout.write(
+                f"{count:>10} {timings[0]:>12.2f} {timings[1]:>12.2f} "
+                f"{timings[0] / timings[1]:>7.1f}x"
+            )
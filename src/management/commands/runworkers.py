@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+# Command line of one worker serving the listening socket `fd`
+SERVERS = {
+    "daphne": lambda fd, options: [
+        sys.executable,
+        "-m",
+        "daphne",
+        "--fd",
+        str(fd),
+        *(["--proxy-headers"] if options["proxy_headers"] else []),
+        options["application"],
+    ],
+    # --loop auto runs on uvloop (requirements.txt), on asyncio where it is not available.
+    # Its permessage-deflate is off: "+deflate" clients compress in the application,
+    # and browsers would otherwise get their frames deflated twice.
+    "uvicorn": lambda fd, options: [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "--fd",
+        str(fd),
+        "--loop",
+        "auto",
+        "--ws",
+        "websockets",
+        "--ws-per-message-deflate",
+        "false",
+        *(["--proxy-headers"] if options["proxy_headers"] else []),
+        options["application"],
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run one ASGI worker process (Uvicorn or Daphne) per CPU core on a single port "
+        "and restart the ones that crash. With SO_REUSEPORT every worker gets its own "
+        "listening socket and the kernel spreads the connections, otherwise they share one. "
+        "SIGUSR1 (drain) is forwarded to every worker, SIGTERM stops them."
+    )
+
+    def add_arguments(self, parser):
+        # Uvicorn waits for the socket to drain on every send, which the send queues
+        # rely on; Daphne buffers whatever the client does not read
+        parser.add_argument("--server", choices=sorted(SERVERS), default="uvicorn")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--host", default="0.0.0.0")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument("--proxy-headers", action="store_true")
+        parser.add_argument("--application", default="src.asgi:application")
+
+    def listen(self, host, port, reuseport):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuseport:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(socket.SOMAXCONN)
+        sock.set_inheritable(True)
+        return sock
+
+    def spawn(self, index):
+        sock = self.sockets[index % len(self.sockets)]
+        if sock is None:  # closed when the worker exited
+            sock = self.sockets[index] = self.listen(
+                self.options["host"], self.options["port"], reuseport=True
+            )
+        command = SERVERS[self.options["server"]](sock.fileno(), self.options)
+        self.stdout.write(f"Worker {index} - Starting")
+        return subprocess.Popen(command, pass_fds=(sock.fileno(),))
+
+    def forward(self, signum, frame):
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.send_signal(signum)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        self.options = options
+        workers = max(1, options["workers"])
+        reuseport = hasattr(socket, "SO_REUSEPORT")
+        self.sockets = [
+            self.listen(options["host"], options["port"], reuseport)
+            for _ in range(workers if reuseport else 1)
+        ]
+        self.stdout.write(
+            f"{workers} {options['server']} workers on {options['host']}:{options['port']}"
+            f" ({'SO_REUSEPORT' if reuseport else 'shared socket'})"
+        )
+        self.processes = [None] * workers
+        started_at = [0.0] * workers
+        failures = [0] * workers  # crashes in a row soon after starting
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, self.forward)
+
+        while not self.stopping:
+            now = time.monotonic()
+            for index, process in enumerate(self.processes):
+                if process is not None:
+                    code = process.poll()
+                    if code is None:
+                        continue
+                    self.stderr.write(f"Worker {index} - Exited with {code}")
+                    failures[index] = failures[index] + 1 if now - started_at[index] < 10 else 0
+                    self.processes[index] = None
+                    if reuseport:
+                        # the kernel would keep queueing connections that nobody
+                        # accepts until the restart, the other workers take them
+                        self.sockets[index].close()
+                        self.sockets[index] = None
+                # back off when a worker keeps crashing on start, up to a minute
+                if now < started_at[index] + min(60, 2 ** failures[index]) - 1:
+                    continue
+                self.processes[index] = self.spawn(index)
+                started_at[index] = now
+            time.sleep(0.5)
+
+        self.forward(signal.SIGTERM, None)
+        deadline = time.monotonic() + 30
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.stdout.write("Workers stopped")
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.models import Project
+from src.ws.connection import get_sync_redis
+from src.ws.shards import pick_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the Redis shard (WS_REDIS_SHARDS) of every project, and with --add "
+        "the projects that would move to a new shard. --ping checks every shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--add", metavar="URL", help="Redis URL of a shard to be added")
+        parser.add_argument("--ping", action="store_true")
+
+    def handle(self, *args, **options):
+        urls = settings.WS_REDIS_SHARDS
+        if options["ping"]:
+            for index, url in enumerate(urls):
+                try:
+                    get_sync_redis(url).ping()
+                    status = "OK"
+                except Exception as e:
+                    status = f"NG - {e}"
+                self.stdout.write(f"shard{index}: {status}")
+
+        projects = sorted(Project.objects.values_list("name", flat=True))
+        counts = [0] * len(urls)
+        for name in projects:
+            counts[pick_shard(name, urls)] += 1
+        for index, count in enumerate(counts):
+            self.stdout.write(f"shard{index}: {count} projects")
+
+        if options["add"]:
+            grown = urls + [options["add"]]
+            moved = [name for name in projects if pick_shard(name, grown) == len(urls)]
+            self.stdout.write(f"Adding {options['add']} moves {len(moved)} projects to it:")
+            for name in moved:
+                self.stdout.write(f"  {name}")
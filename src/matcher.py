@@ -0,0 +1,76 @@
+import re
+
+
+ALLOW = "whitelist"
+DENY = "blacklist"
+
+
+class _Node:
+    __slots__ = ("children", "wildcard")
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None  # rule type of "*.<labels leading here>"
+
+
+class DomainMatcher:
+    """
+    Domain whitelist and blacklist of a project compiled for lookups that do not
+    depend on the number of rules:
+        example.com     -> hash set of exact hosts
+        *.example.com   -> trie of reversed labels (com -> example), matches any subdomain
+    A blacklisted domain is always denied, a whitelisted one is allowed,
+    anything else is allowed only if `allow_any_domains` is set.
+    """
+
+    __slots__ = ("exact", "root", "patterns", "allow_any_domains")
+
+    def __init__(self, rules=(), allow_any_domains=False):
+        self.exact = {}
+        self.root = _Node()
+        self.patterns = []  # rules validate_domain would reject today, matched like before
+        self.allow_any_domains = allow_any_domains
+        for domain, type in rules:
+            self.add(domain, type)
+
+    def add(self, domain, type):
+        domain = domain.lower()
+        if "*" not in domain:
+            if self.exact.get(domain) != DENY:
+                self.exact[domain] = type
+        elif domain.startswith("*.") and "*" not in domain[2:]:
+            node = self.root
+            for label in reversed(domain[2:].split(".")):
+                node = node.children.setdefault(label, _Node())
+            if node.wildcard != DENY:
+                node.wildcard = type
+        else:
+            pattern = re.escape(domain).replace(r"\*", r"[a-z0-9.-]*")
+            self.patterns.append((re.compile(pattern + "$"), type))
+
+    def is_allowed(self, domain):
+        domain = domain.lower()
+        verdict = self.exact.get(domain)
+        if verdict == DENY:
+            return False
+        allowed = verdict == ALLOW
+
+        labels = domain.split(".")
+        node = self.root
+        # a wildcard only matches when at least one label is left over
+        for depth in range(len(labels) - 1, 0, -1):
+            node = node.children.get(labels[depth])
+            if node is None:
+                break
+            if node.wildcard == DENY:
+                return False
+            if node.wildcard == ALLOW:
+                allowed = True
+
+        for pattern, type in self.patterns:
+            if pattern.match(domain):
+                if type == DENY:
+                    return False
+                allowed = True
+
+        return allowed or self.allow_any_domains
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("src", "0003_rename_allow_any_domain_project_allow_any_domains_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="ws_settings",
+            field=models.JSONField(blank=True, default=dict, verbose_name="WebSocket Settings"),
+        ),
+    ]
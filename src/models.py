@@ -1,9 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.db import models
 
 from src.funks import secret_key_generator
-
-import re
+from src.matcher import DomainMatcher
 
 
 class User(AbstractUser):
@@ -28,6 +28,7 @@ class Project(models.Model):
     )
     secret_key = models.CharField(max_length=100, default=secret_key_generator, editable=False)
     allow_any_domains = models.BooleanField(default=False)
+    ws_settings = models.JSONField(default=dict, blank=True, verbose_name="WebSocket Settings")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -41,14 +42,14 @@ class Project(models.Model):
         self.secret_key = secret_key_generator()
         self.save()
 
+    def get_ws_settings(self):
+        return {**settings.WS_PROJECT_DEFAULTS, **(self.ws_settings or {})}
+
+    def domain_matcher(self):
+        return DomainMatcher(self.domains.values_list("domain", "type"), self.allow_any_domains)
+
     def check_domain_allowed(self, domain):
-        blacklist = self.domains.filter(type=Domain.BLACKLIST).values_list("domain", flat=True)
-        blacklist = [re.escape(item).replace(r"\*", r"[a-zA-Z0-9.-]*") for item in blacklist]
-        not_in_blacklist = not any(re.match(item, domain) for item in blacklist)
-        in_whitelist = Domain.objects.filter(
-            domain=domain, project=self, type=Domain.WHILELIST
-        ).exists()
-        return not_in_blacklist and (in_whitelist or self.allow_any_domains)
+        return self.domain_matcher().is_allowed(domain)
 
 
 class Domain(models.Model):
@@ -91,21 +91,46 @@ REDIS_HOST = os.environ["REDIS_HOST"]
 REDIS_PORT = os.environ["REDIS_PORT"]
 REDIS_DB = os.environ["REDIS_DB"]
 REDIS_PASS = os.environ["REDIS_PASS"]
+REDIS_URL = (
+    f"redis://:{REDIS_PASS}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+    if REDIS_PASS
+    else f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+)
 
 WSGI_APPLICATION = "src.wsgi.application"
 ASGI_APPLICATION = "src.asgi.application"
 
+# "redis": every group member gets its copy through Redis
+# "pubsub": one message per worker through Redis pub/sub, fanned out in memory
+CHANNEL_LAYER_MODE = os.environ.get("CHANNEL_LAYER_MODE", "redis")
+CHANNEL_LAYER_BACKENDS = {
+    "redis": "src.ws.layers.ProjectChannelLayer",
+    "pubsub": "src.ws.layers.PubSubProjectChannelLayer",
+}
+
+# Redis instances the projects are spread over, comma separated URLs (REDIS_URL by default).
+# Every project lives on one of them (src/ws/shards.py): its groups, presence and messages.
+WS_REDIS_SHARDS = [
+    url.strip() for url in os.environ.get("WS_REDIS_SHARDS", "").split(",") if url.strip()
+] or [REDIS_URL]
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_MODE],
         "CONFIG": {
-            "hosts": [
-                (f"redis://:{REDIS_PASS}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
-                if REDIS_PASS
-                else (f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
-            ],
+            "hosts": [REDIS_URL],
         },
     },
+    # "shard<n>" is the layer of the projects of WS_REDIS_SHARDS[n]
+    **{
+        f"shard{index}": {
+            "BACKEND": CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_MODE],
+            "CONFIG": {
+                "hosts": [url],
+            },
+        }
+        for index, url in enumerate(WS_REDIS_SHARDS)
+    },
 }
 
 # Database
@@ -128,16 +153,86 @@ DATABASES = {
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": (
-            f"redis://:{REDIS_PASS}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
-            if REDIS_PASS
-            else f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
-        ),
+        "LOCATION": REDIS_URL,
         "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
         "KEY_PREFIX": "ws-service",
     }
 }
 
+# WEBSOCKET
+# Project auth data (secret key, domain rules) cached in every ASGI worker
+WS_PROJECT_CACHE_TTL = 60  # seconds
+WS_PROJECT_CACHE_SIZE = 10000  # projects per process
+# Redis pub/sub channel used to tell every worker that a project has changed
+WS_INVALIDATION_CHANNEL = "ws-service:project-changed"
+# Verified JWT payloads cached in every ASGI worker
+WS_TOKEN_CACHE_SIZE = 100000
+# Connection attempts per second (and burst) allowed from a single IP
+WS_IP_CONNECT_RATE = 5
+WS_IP_CONNECT_BURST = 20
+# Cluster-wide presence of clients: worker heartbeats and the local lookup cache
+WS_PRESENCE_HEARTBEAT_INTERVAL = 10  # seconds
+WS_PRESENCE_WORKER_TTL = 30  # seconds without heartbeat before a worker is swept
+WS_PRESENCE_CACHE_TTL = 1  # seconds
+# Connections are checked for heartbeats and idleness every WS_REAPER_INTERVAL seconds
+WS_REAPER_INTERVAL = 5
+# Drain mode (SIGUSR1): connections are closed in batches every WS_DRAIN_INTERVAL seconds
+# over WS_DRAIN_DURATION seconds, and told to reconnect within WS_DRAIN_RETRY_JITTER seconds
+WS_DRAIN_DURATION = int(os.environ.get("WS_DRAIN_DURATION", 60))
+WS_DRAIN_INTERVAL = 1
+WS_DRAIN_RETRY_JITTER = 30
+# Seconds between two pushes of the metrics of a worker to Redis, for /ws/metrics
+WS_METRICS_INTERVAL = 10
+# Share of the published messages traced from receive to write (0 to disable, 1 for all)
+# the ones slower than WS_TRACE_SLOW_THRESHOLD seconds are kept for /ws/traces
+WS_TRACE_SAMPLE_RATE = float(os.environ.get("WS_TRACE_SAMPLE_RATE", 0))
+WS_TRACE_SLOW_THRESHOLD = 0.25
+WS_TRACE_MAX_SLOW = 100
+# Defaults of Project.ws_settings, every project can override them
+WS_PROJECT_DEFAULTS = {
+    "connect_rate": 50,  # connection attempts per second, 0 to disable the limit
+    "connect_burst": 200,
+    # application-level deflate of clients asking for a "+deflate" subprotocol
+    "compression": True,
+    "compression_threshold": 256,  # bytes, smaller frames are sent uncompressed
+    "compression_level": 6,
+    "compression_window_bits": 15,  # 9 to 15, memory grows with 1 << window bits
+    "compression_mem_level": 8,  # 1 to 9
+    "server_context_takeover": True,  # keep the compression window between messages
+    "client_context_takeover": True,  # keep the decompression window between messages
+    # coalescing of outbound messages for clients connecting with ?batch=1
+    "batch": False,
+    "batch_window_ms": 10,  # how long the first message of a batch may wait
+    "batch_max_messages": 50,
+    # messages waiting to be written to one connection, and what to do when it is full:
+    # "drop_oldest", "drop_newest" or "disconnect" (close code 4008)
+    "send_queue_size": 256,
+    "send_queue_overflow": "drop_oldest",
+    # topics one connection can be subscribed to at the same time
+    "max_topics": 20,
+    # messages kept per project (and per topic) for clients resuming with ?last_id=
+    "replay_max_len": 1000,  # 0 disables replay
+    "replay_max_age": 300,  # seconds
+    # at-least-once delivery of clients connecting with ?ack=1
+    "ack_window": 100,  # unacked messages in flight per connection
+    "ack_timeout": 10,  # seconds before unacked messages are written again
+    "ack_retention": 300,  # seconds unacked messages wait for the client to reconnect
+    # targeted messages kept for clients that are offline
+    "mailbox_max_size": 100,  # messages per client, 0 disables the mailbox
+    "mailbox_ttl": 3600,  # seconds after the last message
+    # "exact" keeps a set of the online client ids, "approximate" a HyperLogLog:
+    # constant memory for very large projects, 0.81% standard error, no listing
+    "presence_counting": "exact",
+    # application level pings of clients connecting with ?heartbeat=1, 0 disables them
+    "heartbeat_interval": 30,  # seconds
+    "heartbeat_max_missed": 2,  # unanswered pings in a row before the connection is closed
+    "idle_timeout": 0,  # seconds without any message but pongs, 0 to never close idle ones
+}
+# Largest message accepted from a client once decompressed
+WS_MAX_MESSAGE_SIZE = 1024 * 1024
+# Messages one request to the HTTP publish API can carry
+WS_PUBLISH_MAX_MESSAGES = 10000
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
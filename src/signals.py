@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from src.models import Domain, Project
+
+
+def project_changed(*names):
+    # imported lazily, the ws package is only needed once a project changes
+    from src.ws.cache import broadcast_project_changed
+
+    def broadcast():
+        for name in set(names):
+            broadcast_project_changed(name)
+
+    # workers must reload the committed data, not the data being written
+    transaction.on_commit(broadcast)
+
+
+@receiver(pre_save, sender=Project)
+def remember_project_name(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_name = (
+            Project.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_saved_or_deleted(sender, instance, **kwargs):
+    previous_name = getattr(instance, "_previous_name", None)
+    project_changed(*filter(None, (instance.name, previous_name)))
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def domain_saved_or_deleted(sender, instance, **kwargs):
+    name = Project.objects.filter(pk=instance.project_id).values_list("name", flat=True).first()
+    if name:  # the project itself is being deleted otherwise
+        project_changed(name)
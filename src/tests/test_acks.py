@@ -0,0 +1,96 @@
+from django.test import SimpleTestCase
+
+from src.funks import validate_ws_settings
+from src.ws.acks import AckWindow, sequenced
+
+import asyncio
+import json
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.events = []
+
+    def put(self, event):
+        self.events.append(event)
+        return True
+
+    def seqs(self):
+        return [json.loads(event["text"])["seq"] for event in self.events]
+
+
+def event(n):
+    return {"type": "send_message", "text": json.dumps({"message": n})}
+
+
+class SequencedTests(SimpleTestCase):
+    def test_splices_seq(self):
+        framed = sequenced(event(1), 7)
+        self.assertEqual(json.loads(framed["text"]), {"seq": 7, "message": 1})
+
+
+class AckWindowTests(SimpleTestCase):
+    async def test_window(self):
+        outbox = FakeOutbox()
+        acks = AckWindow(outbox, window=2, timeout=10, max_waiting=10)
+        for n in range(5):
+            self.assertTrue(acks.put(event(n)))
+        self.assertEqual(outbox.seqs(), [1, 2])
+        self.assertEqual(len(acks), 5)
+        # cumulative: acking 2 acknowledges 1 too
+        self.assertTrue(acks.ack(2))
+        self.assertEqual(outbox.seqs(), [1, 2, 3, 4])
+        self.assertEqual(acks.stats()["in_flight"], 2)
+        self.assertEqual(acks.stats()["waiting"], 1)
+        acks.close()
+
+    async def test_invalid_acks_are_ignored(self):
+        outbox = FakeOutbox()
+        acks = AckWindow(outbox, window=2, timeout=10, max_waiting=10)
+        acks.put(event(0))
+        for seq in (0, 5, "1", 1.0):
+            self.assertTrue(acks.ack(seq))
+        self.assertEqual(acks.acked, 0)
+        acks.close()
+
+    async def test_too_many_waiting(self):
+        acks = AckWindow(FakeOutbox(), window=1, timeout=10, max_waiting=1)
+        self.assertTrue(acks.put(event(0)))
+        self.assertTrue(acks.put(event(1)))
+        self.assertFalse(acks.put(event(2)))
+        acks.close()
+
+    async def test_redelivery(self):
+        outbox = FakeOutbox()
+        acks = AckWindow(outbox, window=10, timeout=0.02, max_waiting=10)
+        acks.put(event(0))
+        acks.put(event(1))
+        await asyncio.sleep(0.05)
+        self.assertEqual(outbox.seqs()[:4], [1, 2, 1, 2])
+        self.assertGreaterEqual(acks.redelivered, 2)
+        acks.ack(2)
+        await asyncio.sleep(0.03)
+        self.assertIsNone(acks._task)
+
+    async def test_zero_timeout_does_not_block_the_loop(self):
+        outbox = FakeOutbox()
+        acks = AckWindow(outbox, window=10, timeout=0, max_waiting=10)
+        acks.put(event(0))
+        await asyncio.wait_for(asyncio.sleep(0.05), 1)
+        self.assertLess(len(outbox.events), 20)
+        acks.close()
+
+    async def test_close_returns_unacked_events(self):
+        acks = AckWindow(FakeOutbox(), window=1, timeout=10, max_waiting=10)
+        events = [event(n) for n in range(3)]
+        for e in events:
+            acks.put(e)
+        self.assertEqual(acks.close(), events)
+        self.assertEqual(len(acks), 0)
+
+
+class AckSettingsTests(SimpleTestCase):
+    def test_window_and_timeout_are_positive(self):
+        self.assertIsNotNone(validate_ws_settings({"ack_timeout": 0})[1])
+        self.assertIsNotNone(validate_ws_settings({"ack_window": 0})[1])
+        self.assertIsNone(validate_ws_settings({"ack_timeout": 1, "ack_window": 1})[1])
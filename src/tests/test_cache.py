@@ -0,0 +1,68 @@
+from django.test import SimpleTestCase
+
+from src.models import Project
+from src.ws.cache import ProjectCache
+
+import asyncio
+import threading
+from unittest import mock
+
+
+class ProjectCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = ProjectCache(ttl=60, maxsize=10)
+        self.loads = []
+        self.release = threading.Event()
+        self.release.set()
+        patcher = mock.patch("src.ws.cache.ProjectAuth.load", side_effect=self.load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, name):
+        self.loads.append(name)
+        self.release.wait(5)
+        if name == "missing":
+            raise Project.DoesNotExist
+        return f"auth of {name}"
+
+    async def test_hit(self):
+        self.assertEqual(await self.cache.get("p"), "auth of p")
+        self.assertEqual(await self.cache.get("p"), "auth of p")
+        self.assertEqual(self.loads, ["p"])
+
+    async def test_concurrent_misses_share_one_load(self):
+        self.release.clear()
+        tasks = [asyncio.ensure_future(self.cache.get("p")) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), ["auth of p"] * 5)
+        self.assertEqual(self.loads, ["p"])
+
+    async def test_missing_projects_are_cached(self):
+        for _ in range(2):
+            with self.assertRaises(Project.DoesNotExist):
+                await self.cache.get("missing")
+        self.assertEqual(self.loads, ["missing"])
+
+    async def test_load_finishing_after_invalidate_is_not_stored(self):
+        self.release.clear()
+        task = asyncio.ensure_future(self.cache.get("p"))
+        await asyncio.sleep(0.05)
+        self.cache.invalidate("p")  # e.g. the secret key changed during the query
+        self.release.set()
+        self.assertEqual(await task, "auth of p")
+        self.assertEqual(len(self.cache), 0)
+        await self.cache.get("p")
+        self.assertEqual(self.loads, ["p", "p"])
+
+    async def test_invalidate(self):
+        await self.cache.get("p")
+        self.cache.invalidate("p")
+        await self.cache.get("p")
+        self.assertEqual(self.loads, ["p", "p"])
+
+    async def test_lru(self):
+        cache = ProjectCache(ttl=60, maxsize=2)
+        for name in ("a", "b", "a", "c"):
+            await cache.get(name)
+        self.assertEqual(list(cache._entries), ["a", "c"])
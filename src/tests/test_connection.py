@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase
+
+from src.ws import connection
+
+import asyncio
+import gc
+
+
+class GetRedisTests(SimpleTestCase):
+    def test_same_client_per_loop_and_url(self):
+        async def clients():
+            return connection.get_redis("redis://localhost:1/0"), connection.get_redis(
+                "redis://localhost:1/0"
+            )
+
+        first, second = asyncio.run(clients())
+        self.assertIs(first, second)
+
+    def test_clients_are_closed_with_their_loop(self):
+        # what async_to_sync does for every call of a WSGI view
+        closed = []
+
+        async def publish():
+            client = connection.get_redis("redis://localhost:1/0")
+            client.close = lambda *args, **kwargs: asyncio.sleep(0, closed.append(client))
+
+        for _ in range(5):
+            asyncio.run(publish())
+        gc.collect()
+        self.assertEqual(len(closed), 5)
+        self.assertEqual(len(connection._clients), 0)
@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+
+from src.funks import validate_ws_settings
+
+
+class ValidateWSSettingsTests(SimpleTestCase):
+    def assertValid(self, ws_settings):
+        self.assertIsNone(validate_ws_settings(ws_settings)[1])
+
+    def assertInvalid(self, ws_settings):
+        self.assertIsNotNone(validate_ws_settings(ws_settings)[1])
+
+    def test_defaults(self):
+        self.assertValid({})
+        self.assertValid({"connect_rate": 0, "send_queue_size": 1, "compression_level": 9})
+
+    def test_not_an_object(self):
+        self.assertInvalid([])
+
+    def test_unknown_setting(self):
+        self.assertInvalid({"unknown": 1})
+
+    def test_integers_reject_floats(self):
+        self.assertInvalid({"compression_level": 6.5})
+        self.assertInvalid({"mailbox_ttl": 3600.5})
+        self.assertInvalid({"ack_retention": 300.0})
+
+    def test_booleans_are_not_integers(self):
+        self.assertInvalid({"send_queue_size": True})
+        self.assertInvalid({"compression": 1})
+
+    def test_minimums(self):
+        self.assertInvalid({"send_queue_size": 0})
+        self.assertInvalid({"batch_max_messages": 0})
+        self.assertInvalid({"mailbox_ttl": 0})
+        self.assertInvalid({"connect_rate": -1})
+
+    def test_ranges(self):
+        self.assertInvalid({"compression_level": 10})
+        self.assertInvalid({"compression_window_bits": 8})
+
+    def test_choices(self):
+        self.assertValid({"send_queue_overflow": "disconnect"})
+        self.assertInvalid({"send_queue_overflow": "block"})
@@ -0,0 +1,49 @@
+from django.test import SimpleTestCase
+
+from src.matcher import ALLOW, DENY, DomainMatcher
+
+
+class DomainMatcherTests(SimpleTestCase):
+    def test_exact(self):
+        matcher = DomainMatcher([("example.com", ALLOW)])
+        self.assertTrue(matcher.is_allowed("example.com"))
+        self.assertTrue(matcher.is_allowed("EXAMPLE.com"))
+        self.assertFalse(matcher.is_allowed("www.example.com"))
+        self.assertFalse(matcher.is_allowed("other.com"))
+
+    def test_wildcard_needs_a_subdomain(self):
+        matcher = DomainMatcher([("*.example.com", ALLOW)])
+        self.assertTrue(matcher.is_allowed("www.example.com"))
+        self.assertTrue(matcher.is_allowed("a.b.example.com"))
+        self.assertFalse(matcher.is_allowed("example.com"))
+        self.assertFalse(matcher.is_allowed("badexample.com"))
+
+    def test_blacklist_wins(self):
+        matcher = DomainMatcher(
+            [("*.example.com", ALLOW), ("bad.example.com", DENY), ("*.evil.com", DENY)],
+            allow_any_domains=True,
+        )
+        self.assertTrue(matcher.is_allowed("good.example.com"))
+        self.assertFalse(matcher.is_allowed("bad.example.com"))
+        self.assertFalse(matcher.is_allowed("www.evil.com"))
+        self.assertTrue(matcher.is_allowed("anything.net"))
+
+    def test_blacklist_wins_whatever_the_order(self):
+        matcher = DomainMatcher([("example.com", DENY), ("example.com", ALLOW)])
+        self.assertFalse(matcher.is_allowed("example.com"))
+        matcher = DomainMatcher([("*.example.com", DENY), ("*.example.com", ALLOW)])
+        self.assertFalse(matcher.is_allowed("www.example.com"))
+
+    def test_top_level_wildcard(self):
+        matcher = DomainMatcher([("*.com", ALLOW)])
+        self.assertTrue(matcher.is_allowed("example.com"))
+        self.assertFalse(matcher.is_allowed("example.net"))
+
+    def test_legacy_patterns(self):
+        matcher = DomainMatcher([("api*.example.com", DENY)], allow_any_domains=True)
+        self.assertFalse(matcher.is_allowed("api2.example.com"))
+        self.assertTrue(matcher.is_allowed("www.example.com"))
+
+    def test_allow_any_domains(self):
+        self.assertFalse(DomainMatcher().is_allowed("example.com"))
+        self.assertTrue(DomainMatcher(allow_any_domains=True).is_allowed("example.com"))
@@ -0,0 +1,73 @@
+from django.test import SimpleTestCase
+
+from src.ws.outbox import DISCONNECT, DROP_NEWEST, DROP_OLDEST, Outbox
+
+import asyncio
+
+
+class Writer:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, events):
+        self.batches.append(events)
+
+
+class OutboxTests(SimpleTestCase):
+    async def test_writes_in_order(self):
+        writer = Writer()
+        outbox = Outbox(writer, 10)
+        for n in range(3):
+            self.assertTrue(outbox.put(n))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(writer.batches, [[0], [1], [2]])
+        self.assertEqual(len(outbox), 0)
+
+    async def test_drop_oldest(self):
+        writer = Writer()
+        outbox = Outbox(writer, 2, DROP_OLDEST)
+        for n in range(4):
+            self.assertTrue(outbox.put(n))
+        self.assertEqual(outbox.stats(), {"depth": 2, "dropped": 2})
+        await asyncio.sleep(0.01)
+        self.assertEqual(writer.batches, [[2], [3]])
+
+    async def test_drop_newest(self):
+        writer = Writer()
+        outbox = Outbox(writer, 2, DROP_NEWEST)
+        for n in range(4):
+            self.assertTrue(outbox.put(n))
+        await asyncio.sleep(0.01)
+        self.assertEqual(writer.batches, [[0], [1]])
+        self.assertEqual(outbox.dropped, 2)
+
+    async def test_disconnect(self):
+        outbox = Outbox(Writer(), 1, DISCONNECT)
+        self.assertTrue(outbox.put(0))
+        self.assertFalse(outbox.put(1))
+        outbox.close()
+
+    async def test_single_slot_queue(self):
+        writer = Writer()
+        outbox = Outbox(writer, 1, DROP_OLDEST)
+        self.assertTrue(outbox.put(0))
+        self.assertTrue(outbox.put(1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(writer.batches, [[1]])
+
+    async def test_batches(self):
+        writer = Writer()
+        outbox = Outbox(writer, 100, window=0.01, max_messages=3)
+        for n in range(4):
+            outbox.put(n)
+        await asyncio.sleep(0.05)
+        self.assertEqual(writer.batches, [[0, 1, 2], [3]])
+
+    async def test_closed(self):
+        writer = Writer()
+        outbox = Outbox(writer, 10)
+        outbox.close()
+        self.assertTrue(outbox.put(0))
+        await asyncio.sleep(0.01)
+        self.assertEqual(writer.batches, [])
@@ -0,0 +1,105 @@
+from django.test import SimpleTestCase
+
+from src.ws.codecs import loads
+from src.ws.layers import ProjectChannelLayer
+from src.ws.publish import publish_many
+
+from unittest import mock
+
+
+WS_SETTINGS = {
+    "replay_max_len": 100,
+    "replay_max_age": 60,
+    "mailbox_max_size": 10,
+    "mailbox_ttl": 60,
+}
+
+
+class Pipeline:
+    """
+    redis.asyncio pipeline that records its commands
+    """
+
+    def __init__(self, results):
+        self.commands = []
+        self.results = results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args))
+
+    async def execute(self):
+        return self.results(self.commands)
+
+
+class PublishManyTests(SimpleTestCase):
+    async def test_one_ordered_send(self):
+        layer = mock.Mock()
+        layer.send_in_order = mock.AsyncMock(return_value=[[], ["p_2"], []])
+        messages = [
+            ({"message": 0}, None, None),
+            ({"message": 1}, [1, 2], None),
+            ({"message": 2}, None, "news"),
+        ]
+        append_many = mock.AsyncMock(return_value=["1-0", "1-1", None])
+        store_many = mock.AsyncMock()
+        with mock.patch("src.ws.publish.replay.append_many", append_many):
+            with mock.patch("src.ws.publish.mailbox.store_many", store_many):
+                await publish_many(layer, "p", messages, ws_settings=WS_SETTINGS)
+
+        entries = append_many.call_args.args[0]
+        self.assertEqual([group for group, _, _ in entries], ["p", "p", "p.topic.news"])
+        self.assertEqual(entries[1][2], ["p_1", "p_2"])
+        layer.send_in_order.assert_awaited_once()
+        deliveries = layer.send_in_order.call_args.args[0]
+        self.assertEqual(
+            [loads(event["text"]) for _, _, event in deliveries],
+            [
+                {"message": 0, "id": "1-0"},
+                {"message": 1, "id": "1-1"},
+                {"message": 2},
+            ],
+        )
+        self.assertEqual(store_many.call_args.args[1], [(["p_2"], deliveries[1][2])])
+
+
+class SendInOrderTests(SimpleTestCase):
+    async def test_scores_follow_the_order(self):
+        layer = ProjectChannelLayer(hosts=["redis://localhost:1/0"])
+        channel = "specific.worker!a"
+
+        def results(commands):
+            if commands[0][0] == "zremrangebyscore":
+                return [0, [channel.encode("utf-8")]]
+            return [0] * len(commands)
+
+        pipelines = []
+
+        def pipeline(transaction):
+            pipelines.append(Pipeline(results))
+            return pipelines[-1]
+
+        redis = mock.Mock(pipeline=pipeline)
+        resolve_many = mock.AsyncMock(return_value={"p_1": [channel], "p_2": []})
+        # odd messages go to the group, even ones to client ids
+        deliveries = [
+            ("p", None if n % 2 else ["p_1", "p_2"], {"type": "send_message", "text": str(n)})
+            for n in range(20)
+        ]
+        with mock.patch("src.ws.layers.get_redis", return_value=redis):
+            with mock.patch("src.ws.layers.presence.resolve_many", resolve_many):
+                offline = await layer.send_in_order(deliveries)
+
+        self.assertEqual(offline, [[] if n % 2 else ["p_2"] for n in range(20)])
+        calls = pipelines[-1].commands
+        self.assertEqual([name for name, _ in calls], ["eval"] * 20)
+        texts = [layer.deserialize(args[3])["text"] for _, args in calls]
+        self.assertEqual(texts, [str(n) for n in range(20)])
+        # the script, one key, its message and capacity, then the time
+        scores = [float(args[5]) for _, args in calls]
+        self.assertEqual(scores, sorted(set(scores)))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from src.ws.outbox import Outbox
+from src.ws.reaper import Reaper
+from src.ws.registry import registry
+
+import time
+
+
+class FakeConsumer:
+    def __init__(self, channel_name, heartbeat):
+        self.channel_name = channel_name
+        self.project = "project"
+        self.client_id = f"project_{channel_name}"
+        self.heartbeat = heartbeat
+        self.ws_settings = settings.WS_PROJECT_DEFAULTS
+        self.last_active = self.last_ping = time.monotonic() - 3600
+        self.missed_pings = 0
+        self.outbox = Outbox(None, 1)
+        self.controls = []
+
+    async def send_control(self, payload):
+        self.controls.append(payload)
+
+
+class ReaperTests(SimpleTestCase):
+    def setUp(self):
+        self.consumers = [FakeConsumer("listener", False), FakeConsumer("pinged", True)]
+        for consumer in self.consumers:
+            registry.add(consumer)
+
+    def tearDown(self):
+        for consumer in self.consumers:
+            registry.remove(consumer)
+
+    async def test_only_heartbeat_clients_are_pinged(self):
+        await Reaper(interval=5).sweep()
+        listener, pinged = self.consumers
+        self.assertEqual(listener.controls, [])
+        self.assertEqual(pinged.controls, [{"action": "ping"}])
+        self.assertEqual(pinged.missed_pings, 1)
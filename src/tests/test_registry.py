@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase
+
+from src.ws.metrics import metrics
+from src.ws.outbox import DROP_OLDEST, Outbox
+from src.ws.registry import ConnectionRegistry, registry
+
+
+class FakeConsumer:
+    def __init__(self, channel_name, client_id, project="project"):
+        self.channel_name = channel_name
+        self.client_id = client_id
+        self.project = project
+        self.compressor = None
+        self.outbox = Outbox(None, 1, DROP_OLDEST)
+
+    def stats(self):
+        return {"send_queue": self.outbox.stats()}
+
+
+class ConnectionRegistryTests(SimpleTestCase):
+    def test_add_and_remove(self):
+        connections = ConnectionRegistry()
+        first, second = FakeConsumer("a", "c1"), FakeConsumer("b", "c1")
+        connections.add(first)
+        connections.add(second)
+        self.assertEqual(connections.channel_names("c1", "project"), {"a", "b"})
+        self.assertEqual(connections.counts(), {"project": 2})
+        self.assertTrue(connections.remove(first))
+        self.assertFalse(connections.remove(first))
+        self.assertTrue(connections.remove(second))
+        self.assertEqual(connections.counts(), {})
+        self.assertNotIn("a", connections)
+
+    def test_dropped_outlives_connections(self):
+        connections = ConnectionRegistry()
+        consumer = FakeConsumer("a", "c1")
+        connections.add(consumer)
+        consumer.outbox.dropped = 3
+        connections.remove(consumer)
+        self.assertEqual(connections.stats()["projects"]["project"]["dropped"], 3)
+        self.assertEqual(connections.stats()["projects"]["project"]["connections"], 0)
+
+
+class RegistryMetricsTests(SimpleTestCase):
+    def test_project_stats_are_exported(self):
+        consumer = FakeConsumer("metrics-test", "metrics_c1", project="metrics")
+        registry.add(consumer)
+        try:
+            text = metrics.render()
+        finally:
+            registry.remove(consumer)
+        self.assertIn('ws_send_queue_depth{project="metrics"} 0', text)
+        self.assertIn('ws_send_queue_dropped_total{project="metrics"} 0', text)
+        self.assertIn('ws_compression_bytes{project="metrics"} 0', text)
+        self.assertIn('ws_registry_bytes{project="metrics"}', text)
+
+    def test_connections_are_walked_once_per_snapshot(self):
+        calls = []
+        stats = registry.stats
+        registry.stats = lambda: calls.append(1) or stats()
+        try:
+            metrics.render()
+            metrics.snapshot()
+        finally:
+            del registry.stats
+        self.assertEqual(len(calls), 2)
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+from src.ws.shards import group_project, pick_shard
+
+
+class PickShardTests(SimpleTestCase):
+    projects = [f"project-{n}" for n in range(3000)]
+    urls = [f"redis://redis-{n}:6379/0" for n in range(4)]
+
+    def test_stable(self):
+        first = [pick_shard(project, self.urls) for project in self.projects]
+        second = [pick_shard(project, list(self.urls)) for project in self.projects]
+        self.assertEqual(first, second)
+
+    def test_spread(self):
+        counts = [0] * len(self.urls)
+        for project in self.projects:
+            counts[pick_shard(project, self.urls)] += 1
+        for count in counts:
+            self.assertAlmostEqual(count / len(self.projects), 1 / len(self.urls), delta=0.05)
+
+    def test_adding_a_shard_only_moves_projects_onto_it(self):
+        urls = self.urls + ["redis://redis-new:6379/0"]
+        moved = 0
+        for project in self.projects:
+            before, after = pick_shard(project, self.urls), pick_shard(project, urls)
+            if before != after:
+                self.assertEqual(after, len(urls) - 1)
+                moved += 1
+        self.assertAlmostEqual(moved / len(self.projects), 1 / len(urls), delta=0.05)
+
+    def test_single_shard(self):
+        self.assertEqual(pick_shard("project", self.urls[:1]), 0)
+
+
+class GroupProjectTests(SimpleTestCase):
+    def test_group_project(self):
+        self.assertEqual(group_project("project"), "project")
+        self.assertEqual(group_project("project.topic.news.eu"), "project")
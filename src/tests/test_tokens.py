@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase
+
+from src.ws.tokens import TokenCache
+
+import jwt
+import time
+from unittest import mock
+
+
+def token(secret_key, **payload):
+    return jwt.encode(payload, secret_key, algorithm="HS256")
+
+
+class TokenCacheTests(SimpleTestCase):
+    def test_hits_and_misses(self):
+        cache = TokenCache(10)
+        value = token("secret", id=1)
+        self.assertEqual(cache.decode("p", "secret", value), {"id": 1})
+        self.assertIs(cache.decode("p", "secret", value), cache.decode("p", "secret", value))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 1, 1))
+        self.assertAlmostEqual(stats["hit_ratio"], 2 / 3)
+
+    def test_invalid_tokens_are_not_cached(self):
+        cache = TokenCache(10)
+        value = token("secret", id=1)
+        with self.assertRaises(jwt.InvalidSignatureError):
+            cache.decode("p", "other", value)
+        with self.assertRaises(jwt.InvalidSignatureError):
+            cache.decode("p", "other", value)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 2)
+
+    def test_expired_tokens_are_verified_again(self):
+        cache = TokenCache(10)
+        now = time.time()
+        value = token("secret", id=1, exp=int(now) + 10)
+        with mock.patch("src.ws.tokens.jwt.decode", wraps=jwt.decode) as decode:
+            cache.decode("p", "secret", value)
+            cache.decode("p", "secret", value)
+            self.assertEqual(decode.call_count, 1)
+            # past its exp for the cache, the signature check decides again
+            with mock.patch("src.ws.tokens.time.time", return_value=now + 20):
+                cache.decode("p", "secret", value)
+            self.assertEqual(decode.call_count, 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_expired_tokens_are_not_cached(self):
+        cache = TokenCache(10)
+        with mock.patch("src.ws.tokens.jwt.decode", return_value={"id": 1, "exp": 1}):
+            cache.decode("p", "secret", "token")
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate_drops_only_that_project(self):
+        cache = TokenCache(10)
+        cache.decode("a", "secret", token("secret", id=1))
+        cache.decode("a", "secret", token("secret", id=2))
+        cache.decode("b", "secret", token("secret", id=1))
+        cache.invalidate("a")
+        self.assertEqual(len(cache), 1)
+        cache.decode("b", "secret", token("secret", id=1))
+        self.assertEqual(cache.hits, 1)
+
+    def test_lru_eviction(self):
+        cache = TokenCache(2)
+        first, second, third = (token("secret", id=n) for n in range(3))
+        cache.decode("p", "secret", first)
+        cache.decode("p", "secret", second)
+        cache.decode("p", "secret", first)  # second is now the least recently used
+        cache.decode("p", "secret", third)
+        self.assertEqual(len(cache), 2)
+        cache.decode("p", "secret", first)
+        self.assertEqual(cache.hits, 2)
+        cache.decode("p", "secret", second)
+        self.assertEqual(cache.misses, 4)
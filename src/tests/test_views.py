@@ -0,0 +1,36 @@
+from django.test import SimpleTestCase
+
+from src.views import parse_publish_message
+
+
+class ParsePublishMessageTests(SimpleTestCase):
+    def test_broadcast(self):
+        message, error = parse_publish_message({"message": "hi"})
+        self.assertIsNone(error)
+        self.assertEqual(message, ({"sender": None, "message": "hi"}, None, None))
+
+    def test_single_receiver(self):
+        message, error = parse_publish_message({"message": "hi", "receivers": 1})
+        self.assertIsNone(error)
+        self.assertEqual(message[1], [1])
+
+    def test_receivers(self):
+        message, error = parse_publish_message({"message": "hi", "receivers": ["a", 2]})
+        self.assertIsNone(error)
+        self.assertEqual(message[1], ["a", 2])
+
+    def test_invalid_receivers(self):
+        for receivers in ({"x": 1}, [["a"]], [None], [True], [1.5]):
+            message, error = parse_publish_message({"message": "hi", "receivers": receivers})
+            self.assertIsNone(message)
+            self.assertIsNotNone(error)
+
+    def test_not_a_message(self):
+        self.assertIsNotNone(parse_publish_message([])[1])
+        self.assertIsNotNone(parse_publish_message({"receivers": [1]})[1])
+
+    def test_topic(self):
+        message, error = parse_publish_message({"message": "hi", "topic": "news"})
+        self.assertIsNone(error)
+        self.assertEqual(message[0]["topic"], "news")
+        self.assertIsNotNone(parse_publish_message({"message": "hi", "topic": "a b"})[1])
@@ -4,6 +4,11 @@ from django.contrib.auth.views import PasswordResetDoneView
 from src.views import (
     index,
     refresh_secret_key,
+    publish,
+    publish_bulk,
+    presence,
+    presence_clients,
+    presence_client,
     PasswordResetView,
     PasswordResetConfirmView,
     signup,
@@ -15,6 +20,13 @@ from src.admin import dashboard_site
 urlpatterns = [
     path("", index, name="index"),
     path("api/refresh_secret_key/<str:project>/", refresh_secret_key, name="refresh_secret_key"),
+    path("api/publish/<str:project>/", publish, name="publish"),
+    path("api/publish/<str:project>/bulk/", publish_bulk, name="publish_bulk"),
+    path("api/presence/<str:project>/", presence, name="presence"),
+    path("api/presence/<str:project>/clients/", presence_clients, name="presence_clients"),
+    path(
+        "api/presence/<str:project>/clients/<str:id>/", presence_client, name="presence_client"
+    ),
     path("dashboard/password_reset/", PasswordResetView.as_view(), name="password_reset"),
     path(
         "dashboard/password_reset/done/",
@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import login
 from django.contrib import messages
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse
 from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth.models import Permission
@@ -11,6 +11,10 @@ from django.utils.translation import gettext_lazy as _
 from django.urls import reverse_lazy
 from django.contrib.auth.views import PasswordContextMixin
 from django.contrib.auth.forms import SetPasswordForm
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 
 from src.forms import RegistrationForm, PasswordResetForm
 from src.models import Project, User, Domain
@@ -20,7 +24,14 @@ from src.funks import (
     check_token_used,
     set_token_used,
 )
+from src.ws.codecs import loads
+from src.ws.presence import presence as presence_registry
+from src.ws.publish import publish_many
+from src.ws.reaper import reaper
+from src.ws.shards import channel_layer_alias
+from src.ws.topics import validate_topic
 
+import hmac
 import jwt
 import threading
 from datetime import datetime, timedelta
@@ -49,6 +60,130 @@ def refresh_secret_key(request, project):
         return HttpResponse("NG", status=400)
 
 
+def get_authorized_project(request, project):
+    """
+    Return the Project `project` if the request has its secret key as bearer token
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        project = Project.objects.get(name=project)
+    except Project.DoesNotExist:
+        return None
+    secret_key = authorization[len("Bearer ") :].encode("utf-8")  # noqa: E203
+    if not hmac.compare_digest(secret_key, project.secret_key.encode("utf-8")):
+        return None
+    return project
+
+
+def parse_publish_message(data):
+    """
+    Return ((payload, receivers, topic), error) of one message sent to the publish API
+    """
+    if not isinstance(data, dict) or "message" not in data:
+        return None, 'Must be a JSON object with a "message"'
+    receivers = data.get("receivers")
+    if receivers is not None and not isinstance(receivers, list):
+        receivers = [receivers]
+    # client ids are "<project>_<id>", only strings and integers make one
+    if receivers is not None and any(type(id) not in (str, int) for id in receivers):
+        return None, "Receivers must be strings or integers"
+    topic = data.get("topic")
+    if topic is not None:
+        topic, error = validate_topic(topic)
+        if error:
+            return None, f"Invalid topic: {error}"
+    payload = {"sender": data.get("sender"), "message": data["message"]}
+    if topic is not None:
+        payload["topic"] = topic
+    return (payload, receivers, topic), None
+
+
+def publish_messages(request, project, lines):
+    project = get_authorized_project(request, project)
+    if project is None:
+        return JsonResponse({"error": "Invalid project or secret key"}, status=401)
+    if len(lines) > settings.WS_PUBLISH_MAX_MESSAGES:
+        error = f"At most {settings.WS_PUBLISH_MAX_MESSAGES} messages per request"
+        return JsonResponse({"error": error}, status=400)
+    parsed = []
+    for number, line in enumerate(lines, 1):
+        try:
+            data = loads(line)
+        except ValueError:
+            return JsonResponse({"error": f"Line {number}: invalid JSON"}, status=400)
+        message, error = parse_publish_message(data)
+        if error:
+            return JsonResponse({"error": f"Line {number}: {error}"}, status=400)
+        parsed.append(message)
+
+    # one event loop and a few pipelines for the whole request
+    async_to_sync(publish_many)(
+        get_channel_layer(channel_layer_alias(project.name)),
+        project.name,
+        parsed,
+        ws_settings=project.get_ws_settings(),
+    )
+    return JsonResponse({"published": len(parsed)})
+
+
+@csrf_exempt
+@require_POST
+def publish(request, project):
+    return publish_messages(request, project, [request.body])
+
+
+@csrf_exempt
+@require_POST
+def publish_bulk(request, project):
+    """
+    One JSON message per line (NDJSON), blank lines are skipped
+    """
+    lines = [line for line in request.body.splitlines() if line.strip()]
+    return publish_messages(request, project, lines)
+
+
+@require_GET
+def presence(request, project):
+    project = get_authorized_project(request, project)
+    if project is None:
+        return JsonResponse({"error": "Invalid project or secret key"}, status=401)
+    exact = project.get_ws_settings()["presence_counting"] == "exact"
+    return JsonResponse(
+        {**presence_registry.count(project.name, exact), "reaped": reaper.totals(project.name)}
+    )
+
+
+@require_GET
+def presence_clients(request, project):
+    """
+    Online client ids, a page per request: pass the returned cursor until it is 0
+    """
+    project = get_authorized_project(request, project)
+    if project is None:
+        return JsonResponse({"error": "Invalid project or secret key"}, status=401)
+    if project.get_ws_settings()["presence_counting"] != "exact":
+        return JsonResponse({"error": "Clients are counted approximately"}, status=400)
+    try:
+        cursor = int(request.GET.get("cursor", 0))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    cursor, client_ids = presence_registry.scan_clients(project.name, cursor)
+    prefix = f"{project.name}_"
+    clients = [client_id[len(prefix) :] for client_id in client_ids]  # noqa: E203
+    return JsonResponse({"cursor": cursor, "clients": clients})
+
+
+@require_GET
+def presence_client(request, project, id):
+    project = get_authorized_project(request, project)
+    if project is None:
+        return JsonResponse({"error": "Invalid project or secret key"}, status=401)
+    connections = presence_registry.connection_count(f"{project.name}_{id}", project.name)
+    return JsonResponse({"online": connections > 0, "connections": connections})
+
+
 def signup(request):
     if request.method == "POST":
         form = RegistrationForm(request.POST)
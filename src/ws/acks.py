@@ -0,0 +1,143 @@
+from src.ws.connection import get_redis
+from src.ws.shards import redis_url
+
+import asyncio
+from collections import OrderedDict, deque
+import time
+
+
+def sequenced(event, seq):
+    """
+    Copy of a message event whose payload starts with "seq".
+    Payloads are never empty JSON objects, the shared text is spliced, not decoded.
+    """
+    return {"type": event["type"], "text": f'{{"seq":{seq},{event["text"][1:]}'}
+
+
+class AckWindow:
+    """
+    At-least-once delivery to one connection. Messages get consecutive sequence
+    numbers, at most `window` of them are unacknowledged at a time, the others
+    wait (up to `max_waiting`). Acks are cumulative: acking n acknowledges every
+    message up to n. When the oldest message is not acked within `timeout`
+    seconds, every unacked message is written again (go-back-N).
+    """
+
+    def __init__(self, outbox, window, timeout, max_waiting):
+        self.outbox = outbox
+        self.window = window
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.seq = 0
+        self.acked = 0
+        self.redelivered = 0
+        self._pending = OrderedDict()  # seq -> [event, sequenced event, sent at]
+        self._waiting = deque()
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending) + len(self._waiting)
+
+    def put(self, event):
+        """
+        Return False if the connection is too slow and must be closed
+        """
+        if len(self._pending) >= self.window:
+            if len(self._waiting) >= self.max_waiting:
+                return False
+            self._waiting.append(event)
+            return True
+        return self._send(event)
+
+    def _send(self, event):
+        self.seq += 1
+        framed = sequenced(event, self.seq)
+        self._pending[self.seq] = [event, framed, time.monotonic()]
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self.outbox.put(framed)
+
+    def ack(self, seq):
+        """
+        Acknowledge every message up to `seq`, return False like put
+        """
+        if type(seq) is not int or not self.acked < seq <= self.seq:
+            return True
+        while self._pending and next(iter(self._pending)) <= seq:
+            self._pending.popitem(last=False)
+        self.acked = seq
+        while self._waiting and len(self._pending) < self.window:
+            if not self._send(self._waiting.popleft()):
+                return False
+        return True
+
+    async def _run(self):
+        try:
+            while self._pending:
+                sent_at = next(iter(self._pending.values()))[2]
+                delay = sent_at + self.timeout - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                now = time.monotonic()
+                for entry in self._pending.values():
+                    # a full queue only delays the next attempt
+                    self.outbox.put(entry[1])
+                    entry[2] = now
+                    self.redelivered += 1
+                # every round yields to the event loop, whatever the timeout
+                await asyncio.sleep(max(self.timeout, 0.01))
+        finally:
+            self._task = None
+
+    def close(self):
+        """
+        Stop redelivering, return the events that were never acked, oldest first
+        """
+        if self._task is not None:
+            self._task.cancel()
+        events = [entry[0] for entry in self._pending.values()] + list(self._waiting)
+        self._pending.clear()
+        self._waiting.clear()
+        return events
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "acked": self.acked,
+            "in_flight": len(self._pending),
+            "waiting": len(self._waiting),
+            "redelivered": self.redelivered,
+        }
+
+
+class UnackedStore:
+    """
+    Messages a client had not acked when its connection closed, kept in Redis
+    for its next connection:
+        <prefix>:<client_id>    list of message texts, oldest first
+    """
+
+    prefix = "ws-service:unacked"
+
+    def _key(self, client_id):
+        return f"{self.prefix}:{client_id}"
+
+    async def save(self, project, client_id, events, max_size, retention):
+        key = self._key(client_id)
+        async with get_redis(redis_url(project)).pipeline(transaction=False) as pipe:
+            pipe.rpush(key, *[event["text"] for event in events])
+            pipe.ltrim(key, -max_size, -1)
+            pipe.expire(key, retention)
+            await pipe.execute()
+
+    async def take(self, project, client_id):
+        key = self._key(client_id)
+        async with get_redis(redis_url(project)).pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            texts, _ = await pipe.execute()
+        return [{"type": "send_message", "text": text.decode("utf-8")} for text in texts]
+
+
+unacked = UnackedStore()
@@ -0,0 +1,154 @@
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from src.models import Project
+from src.ws.connection import get_redis
+from src.ws.tokens import token_cache
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+
+
+class ProjectAuth:
+    """
+    Everything a WebSocket handshake needs to know about a project
+    """
+
+    __slots__ = ("name", "secret_key", "domain_matcher", "ws_settings")
+
+    def __init__(self, name, secret_key, domain_matcher, ws_settings):
+        self.name = name
+        self.secret_key = secret_key
+        self.domain_matcher = domain_matcher
+        self.ws_settings = ws_settings
+
+    @classmethod
+    def load(cls, name):
+        project = Project.objects.get(name=name)
+        return cls(
+            project.name,
+            project.secret_key,
+            project.domain_matcher(),
+            project.get_ws_settings(),
+        )
+
+    def check_domain_allowed(self, domain):
+        return self.domain_matcher.is_allowed(domain)
+
+
+class ProjectCache:
+    """
+    Per-process LRU of ProjectAuth with a TTL.
+    Concurrent misses for the same project share a single database query.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # name -> (expires_at, ProjectAuth or None)
+        self._pending = {}  # name -> Future of the query in flight
+        self._version = 0  # bumped by every invalidation
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, name):
+        """
+        Return the ProjectAuth of `name`, raise Project.DoesNotExist if there is none
+        """
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(name)
+            auth = entry[1]
+        elif name in self._pending:
+            auth = await asyncio.shield(self._pending[name])
+        else:
+            auth = await self._load(name)
+
+        if auth is None:
+            raise Project.DoesNotExist(f"Project {name} does not exist")
+        return auth
+
+    async def _load(self, name):
+        future = asyncio.get_running_loop().create_future()
+        self._pending[name] = future
+        version = self._version
+        try:
+            try:
+                auth = await sync_to_async(ProjectAuth.load)(name)
+            except Project.DoesNotExist:
+                auth = None  # cache misses too, a bad name must not hammer the database
+            if version == self._version:  # not invalidated while querying
+                self._store(name, auth)
+            future.set_result(auth)
+            return auth
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._pending[name]
+
+    def _store(self, name, auth):
+        self._entries[name] = (time.monotonic() + self.ttl, auth)
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, name):
+        self._version += 1
+        self._entries.pop(name, None)
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+
+
+project_cache = ProjectCache(settings.WS_PROJECT_CACHE_TTL, settings.WS_PROJECT_CACHE_SIZE)
+
+_listeners = {}  # event loop -> listener task
+
+
+def broadcast_project_changed(name):
+    """
+    Tell every worker to drop its cached data of project `name`.
+    Called from Django (sync) code, e.g. model signals.
+    """
+    on_project_changed(name)
+    try:
+        get_redis_connection("default").publish(settings.WS_INVALIDATION_CHANNEL, name)
+    except Exception as e:
+        logging.error(f"Project: {name} - Invalidation broadcast failed - {e}")
+
+
+def on_project_changed(name):
+    project_cache.invalidate(name)
+    token_cache.invalidate(name)
+
+
+async def listen_for_project_changes():
+    while True:
+        try:
+            async with get_redis().pubsub() as pubsub:
+                await pubsub.subscribe(settings.WS_INVALIDATION_CHANNEL)
+                # anything may have changed while we were not subscribed
+                project_cache.clear()
+                token_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_project_changed(message["data"].decode("utf-8"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Project invalidation listener - {e}")
+            await asyncio.sleep(1)
+
+
+def ensure_invalidation_listener():
+    loop = asyncio.get_running_loop()
+    task = _listeners.get(loop)
+    if task is None or task.done():
+        _listeners[loop] = loop.create_task(listen_for_project_changes())
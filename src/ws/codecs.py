@@ -0,0 +1,82 @@
+import json
+import msgpack
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is used instead
+    orjson = None
+
+
+def dumps(payload):
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode("utf-8")
+        except TypeError:  # e.g. integers over 64 bits, stdlib json can encode them
+            pass
+    return json.dumps(payload)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONCodec:
+    """
+    JSON text frames, the default when the client asks for no subprotocol
+    """
+
+    name = "json"
+    binary = False
+
+    def decode(self, data):
+        return loads(data)
+
+    def frame(self, event):
+        # messages are encoded to JSON once, when they are published
+        return event["text"]
+
+    def batch(self, frames):
+        return f"[{','.join(frames)}]"
+
+
+class MsgpackCodec:
+    """
+    MessagePack binary frames
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    def frame(self, event):
+        # the event is shared by the local recipients, only the first one transcodes
+        frame = event.get("msgpack")
+        if frame is None:
+            frame = event["msgpack"] = msgpack.packb(loads(event["text"]), use_bin_type=True)
+        return frame
+
+    def batch(self, frames):
+        # an array is its header followed by its packed items
+        return msgpack.Packer().pack_array_header(len(frames)) + b"".join(frames)
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec(), MsgpackCodec())}
+DEFAULT_CODEC = CODECS["json"]
+
+
+def negotiate(subprotocols, deflate=False):
+    """
+    Return (codec, subprotocol, deflate) for the subprotocols offered by the client,
+    the first one we support wins. "<codec>+deflate" is supported if `deflate` is set.
+    """
+    for subprotocol in subprotocols:
+        name, _, extension = subprotocol.partition("+")
+        codec = CODECS.get(name)
+        if codec is None or extension not in ("", "deflate") or (extension and not deflate):
+            continue
+        return codec, subprotocol, bool(extension)
+    return DEFAULT_CODEC, None, False
@@ -0,0 +1,6 @@
+# Close codes sent to clients, 4000-4999 are reserved for applications by RFC 6455
+HEARTBEAT_TIMEOUT = 4000
+IDLE_TIMEOUT = 4001
+SLOW_CONSUMER = 4008
+RECONNECT = 4012  # like 1012 Service Restart, which Daphne cannot send
+RATE_LIMITED = 4029
@@ -0,0 +1,99 @@
+import zlib
+
+
+# Frames of a "+deflate" subprotocol are binary and start with one of these
+RAW = b"\x00"
+DEFLATED = b"\x01"
+
+# The empty stored block a sync flush ends with, left out like RFC 7692 does
+TAIL = b"\x00\x00\xff\xff"
+
+
+class DeflateCompressor:
+    """
+    Application-level deflate codec of one "+deflate" connection, inside ordinary
+    binary frames: this is not the permessage-deflate extension (RFC 7692),
+    which neither Daphne nor ASGI lets an application configure, and clients
+    inflate the frames themselves. Only the deflate stream borrows the framing
+    of RFC 7692. Frames shorter than `threshold` are sent raw. With context
+    takeover the (de)compressor keeps its window between messages: better
+    ratio, more memory.
+    """
+
+    def __init__(
+        self,
+        threshold,
+        level=6,
+        window_bits=15,
+        mem_level=8,
+        server_context_takeover=True,
+        client_context_takeover=True,
+        max_size=1024 * 1024,
+    ):
+        self.threshold = threshold
+        self.level = level
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.server_context_takeover = server_context_takeover
+        self.client_context_takeover = client_context_takeover
+        self.max_size = max_size
+        self._compressor = self._new_compressor() if server_context_takeover else None
+        self._decompressor = self._new_decompressor() if client_context_takeover else None
+
+    @classmethod
+    def from_settings(cls, ws_settings, max_size):
+        return cls(
+            ws_settings["compression_threshold"],
+            ws_settings["compression_level"],
+            ws_settings["compression_window_bits"],
+            ws_settings["compression_mem_level"],
+            ws_settings["server_context_takeover"],
+            ws_settings["client_context_takeover"],
+            max_size,
+        )
+
+    def _new_compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -self.window_bits, self.mem_level)
+
+    def _new_decompressor(self):
+        return zlib.decompressobj(-self.window_bits)
+
+    @property
+    def key(self):
+        """
+        Frames compressed without context takeover only depend on this key,
+        connections sharing it can share the compressed frame
+        """
+        if self.server_context_takeover:
+            return None
+        return f"deflate:{self.threshold}:{self.level}:{self.window_bits}:{self.mem_level}"
+
+    def compress(self, data):
+        if len(data) < self.threshold:
+            return RAW + data
+        compressor = self._compressor or self._new_compressor()
+        data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return DEFLATED + data[: -len(TAIL)]
+
+    def decompress(self, frame):
+        if frame[:1] == RAW:
+            return frame[1:]
+        if frame[:1] != DEFLATED:
+            raise ValueError("Unknown frame flag")
+        decompressor = self._decompressor or self._new_decompressor()
+        data = decompressor.decompress(frame[1:] + TAIL, self.max_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"Message larger than {self.max_size} bytes")
+        return data
+
+    def memory(self):
+        """
+        Approximate bytes held between messages, from the zlib documentation:
+        deflate (1 << (windowBits + 2)) + (1 << (memLevel + 9)), inflate (1 << windowBits) + 7 KB
+        """
+        size = 0
+        if self.server_context_takeover:
+            size += (1 << (self.window_bits + 2)) + (1 << (self.mem_level + 9))
+        if self.client_context_takeover:
+            size += (1 << self.window_bits) + 7 * 1024
+        return size
@@ -0,0 +1,63 @@
+from django.conf import settings
+
+import asyncio
+import redis
+import weakref
+from redis import asyncio as redis_asyncio
+
+
+# redis.asyncio clients are bound to the event loop they were created on
+_clients = weakref.WeakKeyDictionary()  # event loop -> url -> client
+_sync_clients = {}  # url -> client, their connection pools are thread-safe
+
+
+def get_redis(url=None):
+    """
+    Return the Redis client of the running event loop, for settings.REDIS_URL by default
+    """
+    url = url or settings.REDIS_URL
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        clients = _clients[loop] = {}
+        _close_with(loop)
+    client = clients.get(url)
+    if client is None:
+        client = clients[url] = redis_asyncio.from_url(url)
+    return client
+
+
+def _close_with(loop):
+    """
+    Close the clients of `loop` right before it closes, as channels_redis does
+    for its pools. async_to_sync runs every call of a WSGI view on a new event
+    loop: their connections would stay open and keep the closed loops alive.
+    """
+    close = loop.close
+
+    def close_clients():
+        clients = _clients.pop(loop, {})
+        if clients and not loop.is_closed():
+            loop.run_until_complete(_close_clients(clients.values()))
+        del loop.close
+        close()
+
+    try:
+        loop.close = close_clients
+    except AttributeError:
+        pass  # uvloop loops, only the long-lived loops of ASGI workers run on it
+
+
+async def _close_clients(clients):
+    await asyncio.gather(*[client.close() for client in clients], return_exceptions=True)
+
+
+def get_sync_redis(url=None):
+    """
+    Return a blocking Redis client, for settings.REDIS_URL by default
+    """
+    url = url or settings.REDIS_URL
+    client = _sync_clients.get(url)
+    if client is None:
+        client = _sync_clients.setdefault(url, redis.Redis.from_url(url))
+    return client
@@ -1,50 +1,74 @@
 # ws/consumers.py
-from src.settings import CHANNEL_LAYERS
-from src.models import Project
 from src.funks import validate_domain
+from src.ws.acks import AckWindow, unacked
+from src.ws.cache import ensure_invalidation_listener, project_cache
+from src.ws.codecs import loads, negotiate
+from src.ws.codes import RATE_LIMITED, RECONNECT, SLOW_CONSUMER
+from src.ws.compression import DeflateCompressor
+from src.ws.drain import drainer
+from src.ws.mailbox import mailbox
+from src.ws.metrics import (
+    connects,
+    handshake_seconds,
+    messages_in,
+    messages_out,
+    metrics,
+    rejects,
+)
+from src.ws.outbox import Outbox
+from src.ws.presence import presence
+from src.ws.publish import message_event, publish
+from src.ws.ratelimit import rate_limiter
+from src.ws.reaper import reaper
+from src.ws.registry import registry
+from src.ws.shards import channel_layer_alias
+from src.ws.replay import parse_stream_id, replay
+from src.ws.tokens import token_cache
+from src.ws.topics import topic_group, validate_topic
+from src.ws.tracing import marked, tracer
 
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
-import jwt
-from asgiref.sync import sync_to_async
+from django.conf import settings
 import logging
-
-# Add a new method to ChannelLayer
-# We can send message to client with client_id instead of channel_name
-from django.utils.module_loading import import_string
-
-
-async def send_by_client_id(channel_layer, client_id, message, sender_channel_name=None):
-    try:
-        for channel_name in channel_layer.client_map[client_id]:
-            await channel_layer.send(
-                channel_name,
-                {
-                    "type": "send_message",
-                    "message": message,
-                    "sender_channel_name": sender_channel_name,
-                },
-            )
-    except Exception as e:
-        logging.error(e)
-        pass
-
-
-ChannelLayer = import_string(CHANNEL_LAYERS["default"]["BACKEND"])
-ChannelLayer.send_by_client_id = send_by_client_id
-ChannelLayer.client_map = {}
+import time
+from urllib.parse import parse_qs
 
 
 class WSConsumer(AsyncWebsocketConsumer):
+    async def __call__(self, scope, receive, send):
+        # the channel layer is picked before the consumer starts: the project's shard
+        self.channel_layer_alias = channel_layer_alias(scope["url_route"]["kwargs"]["project"])
+        return await super().__call__(scope, receive, send)
+
     async def connect(self):
+        started = time.perf_counter()
         try:
             self.project = self.scope["url_route"]["kwargs"]["project"]
             token = self.scope["url_route"]["kwargs"]["token"]
-            project = await sync_to_async(Project.objects.get)(name=self.project)
+            query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+            if drainer.draining:
+                rejects.inc("draining")
+                await self.reject(RECONNECT)
+                return
+            ip = self.scope["client"][0] if self.scope.get("client") else "Unknown"
+            if not await rate_limiter.allow_ip(ip):
+                rejects.inc("ip_rate_limited")
+                await self.reject(RATE_LIMITED)
+                return
+
+            ensure_invalidation_listener()
+            reaper.ensure_running()
+            metrics.ensure_publisher()
+            project = await project_cache.get(self.project)
+            if not await rate_limiter.allow_project(self.project, project.ws_settings):
+                rejects.inc("project_rate_limited")
+                await self.reject(RATE_LIMITED)
+                return
 
             for key, value in self.scope["headers"]:
                 if key.decode("utf-8") == "origin":
                     if value.decode("utf-8") == "null":
+                        rejects.inc("origin")
                         await self.close()
                         return
                     else:
@@ -54,28 +78,78 @@ class WSConsumer(AsyncWebsocketConsumer):
             else:
                 domain = "Unknown"
 
-            if not await sync_to_async(project.check_domain_allowed)(domain):
+            if not project.check_domain_allowed(domain):
                 logging.error(f"Domain: {domain} - Project: {self.project} - Not allowed")
+                rejects.inc("domain")
                 await self.close()
                 return
 
-            payload = jwt.decode(token, project.secret_key, algorithms=["HS256"])
+            payload = token_cache.decode(self.project, project.secret_key, token)
             if "id" not in payload:
+                rejects.inc("token")
                 await self.close()
                 return
             for key, value in payload.items():
                 setattr(self, key, value)
             self.client_id = f"{self.project}_{self.id}"
+            self.codec, subprotocol, deflate = negotiate(
+                self.scope.get("subprotocols", ()), deflate=project.ws_settings["compression"]
+            )
+            self.compressor = None
+            if deflate:
+                self.compressor = DeflateCompressor.from_settings(
+                    project.ws_settings, settings.WS_MAX_MESSAGE_SIZE
+                )
+            self.ws_settings = ws_settings = project.ws_settings
+            self.max_topics = ws_settings["max_topics"]
+            self.topics = set()
+            self.replayed = {}  # group -> id of the last message replayed from it
+            self.last_active = self.last_ping = time.monotonic()
+            self.missed_pings = 0
+            # pings are data frames, only clients that answer them ask for them
+            self.heartbeat = query.get("heartbeat", ["0"])[0] in ("1", "true")
+            self.batch = ws_settings["batch"] and query.get("batch", ["0"])[0] in ("1", "true")
+            self.outbox = Outbox(
+                self.write_events,
+                ws_settings["send_queue_size"],
+                ws_settings["send_queue_overflow"],
+                window=ws_settings["batch_window_ms"] / 1000 if self.batch else 0,
+                max_messages=ws_settings["batch_max_messages"] if self.batch else 1,
+            )
+            self.acks = None
+            if query.get("ack", ["0"])[0] in ("1", "true"):
+                self.acks = AckWindow(
+                    self.outbox,
+                    ws_settings["ack_window"],
+                    ws_settings["ack_timeout"],
+                    ws_settings["send_queue_size"],
+                )
+            registry.add(self)
             await self.channel_layer.group_add(self.project, self.channel_name)
+            await presence.register(
+                self.client_id,
+                self.channel_name,
+                self.project,
+                exact=ws_settings["presence_counting"] == "exact",
+            )
 
-            if self.client_id in self.channel_layer.client_map:
-                self.channel_layer.client_map[self.client_id].add(self.channel_name)
-            else:
-                self.channel_layer.client_map[self.client_id] = {self.channel_name}
-
-            await self.accept()
+            await self.accept(subprotocol=subprotocol)
+            connects.inc(self.project)
+            handshake_seconds.observe(time.perf_counter() - started)
+            if self.acks is not None:
+                # what the previous connections of the client left unacked comes first
+                for event in await unacked.take(self.project, self.client_id):
+                    self.acks.put(event)
+            # live messages are only dispatched once connect returns, after the replay
+            if "last_id" in query:
+                await self.resume(self.project, query["last_id"][0])
+            # after the replay, so that the messages it already wrote are skipped
+            try:
+                for event in await mailbox.take(self.project, self.client_id):
+                    await self.send_message(event)
+            except Exception as e:
+                logging.error(f"Client: {self.client_id} - Mailbox failed - {e}")
 
-            ip = self.scope["client"][0]
             logging.info(
                 " - ".join(
                     (
@@ -83,54 +157,248 @@ class WSConsumer(AsyncWebsocketConsumer):
                         f"Domain: {domain}",
                         f"Project: {self.project}",
                         f"Client: {self.client_id}",
+                        f"Codec: {subprotocol or self.codec.name}",
                         "Connected",
                     )
                 )
             )
         except Exception as e:
+            rejects.inc("error")  # unknown project, invalid token...
             logging.error(e)
             await self.close()
 
+    async def reject(self, code):
+        # the close code only reaches the client once the handshake is complete
+        await self.accept()
+        await self.close(code=code)
+
+    def stats(self):
+        return {
+            "client_id": self.client_id,
+            "codec": self.codec.name,
+            "compression": self.compressor is not None,
+            "batch": self.batch,
+            "heartbeat": self.heartbeat,
+            "send_queue": self.outbox.stats(),
+            "acks": self.acks.stats() if self.acks is not None else None,
+        }
+
+    async def kick(self, code):
+        # clean up right away, the client may never complete the closing handshake
+        await self.disconnect(code)
+        await self.close(code=code)
+
+    async def drain(self, retry_after):
+        # written directly, the send queue is dropped by the disconnect cleanup
+        hint = message_event({"action": "reconnect", "retry_after": retry_after})
+        await self.write_events([hint])
+        await self.kick(RECONNECT)
+
     async def disconnect(self, close_code):
+        if not registry.remove(self):  # never accepted, or already cleaned up
+            return
+        self.outbox.close()
+        if self.acks is not None:
+            events = self.acks.close()
+            if events:
+                try:
+                    await unacked.save(
+                        self.project,
+                        self.client_id,
+                        events,
+                        self.acks.window + self.acks.max_waiting,
+                        self.ws_settings["ack_retention"],
+                    )
+                except Exception as e:
+                    logging.error(f"Client: {self.client_id} - Saving unacked failed - {e}")
+        groups = [self.project] + [topic_group(self.project, topic) for topic in self.topics]
+        for group in groups:
+            try:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            except Exception as e:
+                logging.error(f"Client: {self.client_id} - group_discard {group} failed - {e}")
         try:
-            self.channel_layer.client_map[self.client_id].remove(self.channel_name)
-            self.channel_layer.group_discard(self.project, self.channel_name)
-        except:
-            pass
+            await presence.unregister(self.client_id, self.channel_name, self.project)
+        except Exception as e:
+            logging.error(f"Client: {self.client_id} - Presence unregister failed - {e}")
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        messages_in.inc(self.project)
+        trace = tracer.start(self.project)
         try:
-            text_data_json = json.loads(text_data)
-            if "receivers" in text_data_json:  # send to specific user
-                receivers = text_data_json["receivers"]
-
-                if not isinstance(receivers, list):  # if receivers is not list
-                    receivers = [receivers]  # convert to list of one element
-
-                for id in receivers:
-                    await self.channel_layer.send_by_client_id(
-                        client_id=f"{self.project}_{id}",
-                        message={
-                            "sender": self.id,
-                            "message": text_data_json["message"],
-                        },
-                        sender_channel_name=self.channel_name,
-                    )
-            else:  # send to all users if receivers is not specified
-                await self.channel_layer.group_send(
-                    self.project,
-                    {
-                        "type": "send_message",
-                        "message": {
-                            "sender": self.id,
-                            "message": text_data_json["message"],
-                        },
-                        "sender_channel_name": self.channel_name,
-                    },
-                )
+            if text_data is not None:
+                text_data_json = loads(text_data)
+            elif self.compressor is not None:
+                text_data_json = self.codec.decode(self.compressor.decompress(bytes_data))
+            else:
+                text_data_json = self.codec.decode(bytes_data)
+            if trace is not None:
+                trace = marked(trace, "parsed")
+            # any message proves that the connection is alive
+            self.missed_pings = 0
+            action = text_data_json.get("action")
+            if action == "pong":
+                return
+            self.last_active = time.monotonic()
+            if action == "ack":
+                if self.acks is not None and not self.acks.ack(text_data_json.get("seq")):
+                    await self.overflowed()
+                return
+            if action == "subscribe":
+                await self.subscribe(text_data_json.get("topic"), text_data_json.get("last_id"))
+                return
+            if action == "unsubscribe":
+                await self.unsubscribe(text_data_json.get("topic"))
+                return
+
+            receivers = text_data_json.get("receivers")  # send to all users if not specified
+            if receivers is not None and not isinstance(receivers, list):
+                receivers = [receivers]  # convert to list of one element
+            payload = {"sender": self.id, "message": text_data_json["message"]}
+            topic = text_data_json.get("topic")
+            if topic is not None:
+                topic, error = validate_topic(topic)
+                if error:
+                    await self.send_control({"action": "error", "error": error})
+                    return
+                payload["topic"] = topic
+
+            await publish(
+                self.channel_layer,
+                self.project,
+                payload,
+                receivers=receivers,
+                topic=topic,
+                exclude=self.channel_name,
+                ws_settings=self.ws_settings,
+                trace=trace,
+            )
         except:
             pass
 
+    async def subscribe(self, topic, last_id=None):
+        topic, error = validate_topic(topic)
+        if not error and topic not in self.topics and len(self.topics) >= self.max_topics:
+            error = f"Too many topics, at most {self.max_topics}"
+        if error:
+            await self.send_control({"action": "error", "topic": topic, "error": error})
+            return
+        if topic not in self.topics:
+            self.topics.add(topic)
+            await self.channel_layer.group_add(
+                topic_group(self.project, topic), self.channel_name
+            )
+        await self.send_control({"action": "subscribed", "topic": topic})
+        if last_id is not None:
+            await self.resume(topic_group(self.project, topic), last_id, topic)
+
+    async def resume(self, group, last_id, topic=None):
+        """
+        Write the messages of `group` sent after `last_id`, then tell the client
+        whether some of them were already trimmed from the replay buffer
+        """
+        last = parse_stream_id(last_id)
+        if last is None:
+            error = "Invalid last_id"
+            await self.send_control({"action": "error", "topic": topic, "error": error})
+            return
+        try:
+            payloads, complete = await replay.read(
+                group, last_id, self.client_id, self.ws_settings["replay_max_len"]
+            )
+        except Exception as e:
+            logging.error(f"Client: {self.client_id} - Replay of {group} failed - {e}")
+            payloads, complete = [], False
+        if payloads:
+            last = parse_stream_id(payloads[-1]["id"])
+        self.replayed[group] = last
+        # bounded by replay_max_len rather than by the send queue
+        events = [message_event(payload) for payload in payloads]
+        size = self.outbox.max_messages
+        for i in range(0, len(events), size):
+            await self.write_events(events[i : i + size])  # noqa: E203
+        await self.send_control(
+            {"action": "replayed", "topic": topic, "count": len(payloads), "complete": complete}
+        )
+
+    async def unsubscribe(self, topic):
+        if topic in self.topics:
+            self.topics.discard(topic)
+            await self.channel_layer.group_discard(
+                topic_group(self.project, topic), self.channel_name
+            )
+        await self.send_control({"action": "unsubscribed", "topic": topic})
+
+    async def send_control(self, payload):
+        # replies to control messages go through the send queue, they are never acked
+        if not self.outbox.put(message_event(payload)):
+            await self.overflowed()
+
     async def send_message(self, event):
-        if event["sender_channel_name"] != self.channel_name:
-            await self.send(text_data=json.dumps(event["message"]))
+        replayed = self.replayed.get(event.get("group"))
+        if replayed is not None and parse_stream_id(event["id"]) <= replayed:
+            return  # already written by the replay
+        trace = event.get("trace")
+        if trace is not None:
+            trace = marked(trace, "delivered")
+            if self.acks is not None:
+                tracer.finish(trace)  # sequenced events do not carry it
+            else:
+                event = {**event, "trace": trace}
+        queue = self.acks if self.acks is not None else self.outbox
+        if not queue.put(event):
+            await self.overflowed()
+
+    async def overflowed(self):
+        logging.error(f"Client: {self.client_id} - Send queue full - Disconnected")
+        await self.kick(SLOW_CONSUMER)
+
+    async def write_events(self, events):
+        messages_out.inc(self.project, amount=len(events))
+        traces = (
+            [event["trace"] for event in events if "trace" in event]
+            if tracer.sample_rate
+            else ()
+        )
+        dequeued = time.time() if traces else None
+        if self.batch:
+            await self.write_batch(events)
+        else:
+            for event in events:
+                await self.write(self.encode(event))
+        if traces:
+            written = time.time()
+            for trace in traces:
+                tracer.finish(marked(marked(trace, "dequeued", dequeued), "written", written))
+
+    async def write(self, frame):
+        if isinstance(frame, str):
+            await self.send(text_data=frame)
+        else:
+            await self.send(bytes_data=frame)
+
+    async def write_batch(self, events):
+        frame = self.codec.batch([self.codec.frame(event) for event in events])
+        if self.compressor is not None:
+            frame = self.compressor.compress(
+                frame if self.codec.binary else frame.encode("utf-8")
+            )
+        await self.write(frame)
+
+    def encode(self, event):
+        if self.compressor is None:
+            return self.codec.frame(event)
+
+        key = self.compressor.key
+        if key is not None:  # no context takeover, the recipients of the event can share it
+            key = f"{self.codec.name}:{key}"
+            frame = event.get(key)
+            if frame is not None:
+                return frame
+        frame = self.codec.frame(event)
+        if not self.codec.binary:
+            frame = frame.encode("utf-8")
+        frame = self.compressor.compress(frame)
+        if key is not None:
+            event[key] = frame
+        return frame
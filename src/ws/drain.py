@@ -0,0 +1,70 @@
+from django.conf import settings
+
+from src.ws.registry import registry
+
+import asyncio
+import logging
+import math
+import random
+import signal
+
+
+class Drainer:
+    """
+    Drain mode of this process, started by SIGUSR1 before a deploy stops it:
+    readiness fails, new handshakes are refused, and open connections are closed
+    in batches spread over `duration` seconds, each client told to reconnect
+    after a random delay of up to `retry_jitter` seconds. Reconnects then reach
+    the other workers over minutes instead of all at once.
+    """
+
+    def __init__(self, duration, interval, retry_jitter):
+        self.duration = duration
+        self.interval = interval
+        self.retry_jitter = retry_jitter
+        self.draining = False
+        self.drained = 0
+        self._task = None
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, self.on_signal)
+
+    def on_signal(self, signum, frame):
+        self.draining = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # not serving yet, there is nothing to close
+            return
+        loop.call_soon_threadsafe(self.start)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.drain())
+
+    async def drain(self):
+        batches = max(1, math.floor(self.duration / self.interval))
+        size = max(1, math.ceil(len(registry) / batches))
+        logging.info(
+            f"Drain - Closing {len(registry)} connections, {size} every {self.interval}s"
+        )
+        while len(registry):
+            consumers = registry.connections()[:size]
+            results = await asyncio.gather(
+                *[
+                    consumer.drain(round(random.uniform(0, self.retry_jitter), 1))
+                    for consumer in consumers
+                ],
+                return_exceptions=True,
+            )
+            for consumer, result in zip(consumers, results):
+                if isinstance(result, Exception):
+                    logging.error(f"Client: {consumer.client_id} - Drain failed - {result}")
+                    registry.remove(consumer)  # do not retry it forever
+            self.drained += len(consumers)
+            await asyncio.sleep(self.interval)
+        logging.info(f"Drain - Done, {self.drained} connections closed")
+
+
+drainer = Drainer(
+    settings.WS_DRAIN_DURATION, settings.WS_DRAIN_INTERVAL, settings.WS_DRAIN_RETRY_JITTER
+)
@@ -0,0 +1,53 @@
+from src.ws.codecs import dumps
+from src.ws.drain import drainer
+from src.ws.metrics import metrics
+from src.ws.tracing import tracer
+
+from urllib.parse import parse_qs
+
+
+class HealthCheckMiddleware:
+    """
+    Answers the liveness and readiness probes and the metrics of a worker
+    before Django sees the request, so they never touch the database:
+        /ws/healthz    200 while the process serves requests
+        /ws/readyz     503 once the worker drains
+        /ws/metrics    Prometheus metrics of every worker, ?scope=worker for this one
+        /ws/traces     JSON list of the last slow traced messages, ?count=<n>
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"] == "/ws/healthz":
+            return await self.respond(send, 200, b"OK")
+        if scope["path"] == "/ws/readyz":
+            if drainer.draining:
+                return await self.respond(send, 503, b"Draining")
+            return await self.respond(send, 200, b"OK")
+        if scope["path"] == "/ws/metrics":
+            if scope.get("query_string", b"") == b"scope=worker":
+                body = metrics.render()
+            else:
+                body = await metrics.render_cluster()
+            return await self.respond(
+                send, 200, body.encode("utf-8"), b"text/plain; version=0.0.4"
+            )
+        if scope["path"] == "/ws/traces":
+            count = parse_qs(scope.get("query_string", b"").decode("utf-8")).get("count", [""])
+            traces = await tracer.slow(int(count[0]) if count[0].isdigit() else None)
+            return await self.respond(
+                send, 200, dumps(traces).encode("utf-8"), b"application/json"
+            )
+        return await self.app(scope, receive, send)
+
+    async def respond(self, send, status, body, content_type=b"text/plain"):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", content_type), (b"cache-control", b"no-store")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
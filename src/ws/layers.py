@@ -0,0 +1,341 @@
+from channels_redis.core import RedisChannelLayer
+
+from src.ws.connection import get_redis
+from src.ws.metrics import fanout, layer_send_seconds, send_failures
+from src.ws.presence import presence
+
+import asyncio
+import logging
+import time
+
+
+# Same as the script of RedisChannelLayer.group_send, plus the expiry cleanup
+# it otherwise does with a separate command per channel
+SEND_MANY_SCRIPT = """
+local over_capacity = 0
+local current_time = ARGV[#ARGV - 1]
+local expiry = ARGV[#ARGV]
+for i=1,#KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, current_time - expiry)
+    if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+        redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+        redis.call('EXPIRE', KEYS[i], expiry)
+    else
+        over_capacity = over_capacity + 1
+    end
+end
+return over_capacity
+"""
+
+
+class ProjectChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer that can address clients by client_id,
+    see src.ws.presence for how client ids are resolved to channel names.
+    """
+
+    async def send_many(self, channel_names, message, exclude=None):
+        """
+        Send `message` to every channel but `exclude` with one script call per Redis host.
+        Channels of the same process share a Redis key and a single copy of the message.
+        """
+        channel_names = [name for name in dict.fromkeys(channel_names) if name != exclude]
+        if not channel_names:
+            return
+        started = time.perf_counter()
+        connection_to_keys, key_to_message, key_to_capacity = (
+            self._map_channel_keys_to_connection(channel_names, message)
+        )
+        for index, keys in connection_to_keys.items():
+            args = self._send_many_args(keys, key_to_message, key_to_capacity, time.time())
+            async with self.connection(index) as connection:
+                over_capacity = await connection.eval(SEND_MANY_SCRIPT, keys=keys, args=args)
+            if over_capacity:
+                logging.error(f"{over_capacity} of {len(keys)} channels over capacity")
+        layer_send_seconds.observe(time.perf_counter() - started, "send_many")
+        fanout.observe(len(channel_names), "send_many")
+
+    def _send_many_args(self, keys, key_to_message, key_to_capacity, current_time):
+        args = [key_to_message[key] for key in keys]
+        args += [key_to_capacity[key] for key in keys]
+        return args + [current_time, self.expiry]
+
+    async def send_in_order(self, deliveries):
+        """
+        Send the (group, client_ids, message) `deliveries` to their client ids,
+        or to their group when client_ids is None, so that every recipient gets
+        them in order: the recipients of all of them are looked up, then all the
+        messages written, in one pipeline each. Return the client ids without
+        connection of every delivery.
+        """
+        # every layer has one host: the Redis shard of the projects it serves
+        address = self.hosts[0]["address"]
+        redis = get_redis(address)
+        started = time.perf_counter()
+        members = await self._group_members(
+            redis, [group for group, client_ids, _ in deliveries if client_ids is None]
+        )
+        resolved = await presence.resolve_many(
+            [client_id for _, client_ids, _ in deliveries for client_id in client_ids or ()],
+            address,
+        )
+        offline, scripts = [], []
+        # a channel key is a sorted set read lowest score first, equal scores
+        # would leave the order of its messages to their random prefix
+        current_time = time.time()
+        async with redis.pipeline(transaction=False) as pipe:
+            for i, (group, client_ids, message) in enumerate(deliveries):
+                score = current_time + i * 1e-6
+                if client_ids is None:
+                    offline.append([])
+                    scripts.append(self._queue_group_send(pipe, group, message, members, score))
+                    continue
+                client_ids = list(dict.fromkeys(client_ids))
+                offline.append([id for id in client_ids if not resolved[id]])
+                channel_names = [name for id in client_ids for name in resolved[id]]
+                scripts.append(self._queue_send_many(pipe, channel_names, message, score))
+            results = await pipe.execute()
+        over_capacity = sum(result for result, script in zip(results, scripts) if script)
+        if over_capacity:
+            logging.error(f"{over_capacity} channels over capacity")
+        layer_send_seconds.observe(time.perf_counter() - started, "send_in_order")
+        return offline
+
+    async def _group_members(self, redis, groups):
+        """
+        Return {group: channel names} of `groups`, in one round trip
+        """
+        groups = list(dict.fromkeys(groups))
+        if not groups:
+            return {}
+        async with redis.pipeline(transaction=False) as pipe:
+            for group in groups:
+                assert self.valid_group_name(group), "Group name not valid"
+                group_key = self._group_key(group)
+                pipe.zremrangebyscore(group_key, 0, int(time.time()) - self.group_expiry)
+                pipe.zrange(group_key, 0, -1)
+            results = await pipe.execute()
+        return {
+            group: [name.decode("utf-8") for name in names]
+            for group, names in zip(groups, results[1::2])
+        }
+
+    def _queue_send_many(self, pipe, channel_names, message, current_time):
+        """
+        Queue the send_many of `message` on `pipe`, return True if a script call was queued
+        """
+        channel_names = list(dict.fromkeys(channel_names))
+        fanout.observe(len(channel_names), "send_in_order")
+        if not channel_names:
+            return False
+        connection_to_keys, key_to_message, key_to_capacity = (
+            self._map_channel_keys_to_connection(channel_names, message)
+        )
+        keys = connection_to_keys[0]
+        args = self._send_many_args(keys, key_to_message, key_to_capacity, current_time)
+        pipe.eval(SEND_MANY_SCRIPT, len(keys), *keys, *args)
+        return True
+
+    def _queue_group_send(self, pipe, group, message, members, current_time):
+        return self._queue_send_many(pipe, members[group], message, current_time)
+
+    async def send_to_clients(self, client_ids, message, exclude=None):
+        """
+        Send `message` to every connection of `client_ids`, return the client ids
+        that have none
+        """
+        # every layer has one host: the Redis shard of the projects it serves
+        resolved = await presence.resolve_many(client_ids, self.hosts[0]["address"])
+        channel_names = [name for names in resolved.values() for name in names]
+        await self.send_many(channel_names, message, exclude=exclude)
+        return [client_id for client_id, names in resolved.items() if not names]
+
+    async def send_by_client_id(self, client_id, message, exclude=None):
+        try:
+            await self.send_to_clients([client_id], message, exclude=exclude)
+        except Exception as e:
+            send_failures.inc("send_by_client_id")
+            logging.error(e)
+
+    async def group_send(self, group, message, exclude=None):
+        """
+        RedisChannelLayer.group_send that drops `exclude` before anything is sent
+        """
+        assert self.valid_group_name(group), "Group name not valid"
+        group_key = self._group_key(group)
+        async with self.connection(self.consistent_hash(group)) as connection:
+            await connection.zremrangebyscore(
+                group_key, min=0, max=int(time.time()) - self.group_expiry
+            )
+            channel_names = [name.decode("utf-8") for name in await connection.zrange(group_key)]
+        await self.send_many(channel_names, message, exclude=exclude)
+
+
+class PubSubProjectChannelLayer(ProjectChannelLayer):
+    """
+    Layer mode where group messages are fanned out in memory: every worker
+    subscribes once to a Redis pub/sub topic per group with local members,
+    so a group_send is one PUBLISH whatever the size of the group.
+    Direct sends (send, send_many, send_to_clients) still go through the
+    Redis key of the receiving process, which one task per worker reads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._inboxes = {}  # local channel name -> asyncio.Queue
+        self._groups = {}  # group -> set of local channel names
+        self._pubsubs = {}  # host index -> PubSub
+        self._tasks = {}  # host index (or "reader") -> task
+
+    def _redis(self, index):
+        return get_redis(self.hosts[index]["address"])
+
+    def _topic(self, group):
+        return f"{self.prefix}:group:{group}"
+
+    def _group(self, topic):
+        return topic[len(self.prefix) + len(":group:") :]  # noqa: E203
+
+    def _start(self, name, coroutine_function, *args):
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            self._tasks[name] = asyncio.get_running_loop().create_task(coroutine_function(*args))
+
+    # Channels
+
+    async def new_channel(self, prefix="specific"):
+        channel = await super().new_channel(prefix)
+        if "!" in channel:
+            self._inboxes[channel] = asyncio.Queue()
+        return channel
+
+    def _deliver(self, channel, message):
+        inbox = self._inboxes.get(channel)
+        if inbox is None:  # the consumer is gone
+            return
+        if inbox.qsize() >= self.get_capacity(channel):
+            inbox.get_nowait()  # drop the oldest, like RedisChannelLayer does
+        inbox.put_nowait(message)
+
+    async def _read(self):
+        """
+        Move the messages sent to channels of this process into their inboxes
+        """
+        name = self.non_local_name(f"specific.{self.client_prefix}!")
+        redis = self._redis(self.consistent_hash(name))
+        key = self.prefix + name
+        while True:
+            try:
+                result = await redis.bzpopmin(key, timeout=self.brpop_timeout)
+                if result is None:
+                    continue
+                _, data, score = result
+                if score < time.time() - self.expiry:
+                    continue
+                message = self.deserialize(data)
+                channels = message.pop("__asgi_channel__")
+                for channel in [channels] if isinstance(channels, str) else channels:
+                    self._deliver(channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Channel layer reader - {e}")
+                await asyncio.sleep(1)
+
+    async def receive(self, channel):
+        inbox = self._inboxes.get(channel)
+        if inbox is None:
+            return await super().receive(channel)
+        self._start("reader", self._read)
+        try:
+            return await inbox.get()
+        except asyncio.CancelledError:
+            # the consumer stopped listening, it will not come back
+            del self._inboxes[channel]
+            groups = [group for group, members in self._groups.items() if channel in members]
+            for group in groups:
+                if self._leave(group, channel):
+                    asyncio.get_running_loop().create_task(self._unsubscribe(group))
+            raise
+
+    # Groups
+
+    async def _listen(self, index):
+        while True:
+            try:
+                message = await self._pubsubs[index].get_message(
+                    ignore_subscribe_messages=True, timeout=1
+                )
+                if message is None:
+                    continue
+                group = self._group(message["channel"].decode("utf-8"))
+                message = self.deserialize(message["data"])
+                exclude = message.pop("__exclude__", None)
+                # every local member gets the same message object
+                members = self._groups.get(group, ())
+                for channel in members:
+                    if channel != exclude:
+                        self._deliver(channel, message)
+                fanout.observe(len(members), "pubsub")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis.asyncio reconnects and subscribes again on its own
+                logging.error(f"Channel layer listener - {e}")
+                await asyncio.sleep(1)
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        if channel not in self._inboxes:  # not a channel of this process
+            return await super().group_add(group, channel)
+        members = self._groups.get(group)
+        if members is None:
+            members = self._groups[group] = set()
+            index = self.consistent_hash(group)
+            pubsub = self._pubsubs.get(index)
+            if pubsub is None:
+                pubsub = self._pubsubs[index] = self._redis(index).pubsub()
+            await pubsub.subscribe(self._topic(group))
+            self._start(index, self._listen, index)
+        members.add(channel)
+
+    def _leave(self, group, channel):
+        """
+        Return True if `group` has no local member left
+        """
+        members = self._groups[group]
+        members.discard(channel)
+        if members:
+            return False
+        del self._groups[group]
+        return True
+
+    async def _unsubscribe(self, group):
+        if group not in self._groups:  # nobody joined again in the meantime
+            await self._pubsubs[self.consistent_hash(group)].unsubscribe(self._topic(group))
+
+    async def group_discard(self, group, channel):
+        members = self._groups.get(group)
+        if members is None or channel not in members:
+            if channel not in self._inboxes:  # not a channel of this process
+                await super().group_discard(group, channel)
+            return
+        if self._leave(group, channel):
+            await self._unsubscribe(group)
+
+    async def _group_members(self, redis, groups):
+        return {}  # the workers with members fan out the group messages
+
+    def _queue_group_send(self, pipe, group, message, members, current_time):
+        assert self.valid_group_name(group), "Group name not valid"
+        pipe.publish(self._topic(group), self.serialize(message))
+        return False
+
+    async def group_send(self, group, message, exclude=None):
+        assert self.valid_group_name(group), "Group name not valid"
+        if exclude is not None:
+            message = {**message, "__exclude__": exclude}
+        redis = self._redis(self.consistent_hash(group))
+        started = time.perf_counter()
+        await redis.publish(self._topic(group), self.serialize(message))
+        layer_send_seconds.observe(time.perf_counter() - started, "publish")
@@ -0,0 +1,59 @@
+from src.ws.codecs import dumps, loads
+from src.ws.connection import get_redis
+from src.ws.shards import redis_url
+
+import logging
+
+
+class Mailbox:
+    """
+    Targeted messages of clients that had no connection when they were sent,
+    kept in Redis until the client connects again:
+        <prefix>:<client_id>    list of {"text", "group", "id"} JSON, oldest first
+    Every list keeps `mailbox_max_size` messages at most and expires
+    `mailbox_ttl` seconds after its last message.
+    """
+
+    prefix = "ws-service:mailbox"
+    fields = ("text", "group", "id")
+
+    def _key(self, client_id):
+        return f"{self.prefix}:{client_id}"
+
+    async def store(self, project, client_ids, event, ws_settings):
+        await self.store_many(project, [(client_ids, event)], ws_settings)
+
+    async def store_many(self, project, entries, ws_settings):
+        """
+        Store the (client_ids, event) `entries` in their order, with one round trip
+        """
+        max_size, ttl = ws_settings["mailbox_max_size"], ws_settings["mailbox_ttl"]
+        if not max_size or not ttl or not entries:
+            return
+        try:
+            async with get_redis(redis_url(project)).pipeline(transaction=False) as pipe:
+                for client_ids, event in entries:
+                    entry = dumps({key: event[key] for key in self.fields if key in event})
+                    for client_id in client_ids:
+                        key = self._key(client_id)
+                        pipe.rpush(key, entry)
+                        pipe.ltrim(key, -max_size, -1)
+                        pipe.expire(key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            client_ids = dict.fromkeys(id for client_ids, _ in entries for id in client_ids)
+            logging.error(f"Mailbox - Clients: {', '.join(client_ids)} - {e}")
+
+    async def take(self, project, client_id):
+        """
+        Return the message events waiting for `client_id` and empty its mailbox
+        """
+        key = self._key(client_id)
+        async with get_redis(redis_url(project)).pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            entries, _ = await pipe.execute()
+        return [{"type": "send_message", **loads(entry)} for entry in entries]
+
+
+mailbox = Mailbox()
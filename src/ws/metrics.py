@@ -0,0 +1,318 @@
+from django.conf import settings
+
+from src.ws.codecs import dumps, loads
+from src.ws.connection import get_redis
+from src.ws.reaper import reaper
+from src.ws.registry import registry
+from src.ws.tokens import token_cache
+
+import asyncio
+import bisect
+import logging
+import os
+import socket
+import time
+
+
+# seconds, from a local Redis round trip to a slow handshake
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+
+class Metric:
+    """
+    Values of one metric in this process, by label values. Every worker runs a
+    single event loop thread, so updates are plain dict operations, no locks.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> value
+
+    def samples(self):
+        """
+        [(label values, value)], `collect` of the gauges computed when scraped
+        """
+        return list(self.values.items())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect  # returns {label values: value}
+
+    def samples(self):
+        return list(self.collect().items())
+
+
+class CollectedCounter(Gauge):
+    """
+    Counter kept by another object, read when scraped
+    """
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        # counts per bucket (not cumulative, the last one is +Inf), sum
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+    Every worker also pushes a snapshot to Redis every `interval` seconds:
+        <prefix>    hash of worker id -> {"time": ..., "metrics": snapshot}
+    so that any worker can render the sum over all the live ones.
+    """
+
+    prefix = "ws-service:metrics"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.metrics = []
+        self.snapshots = 0  # lets collect functions share work within one snapshot
+        self._tasks = {}  # event loop -> publisher task
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def snapshot(self):
+        self.snapshots += 1
+        return {
+            metric.name: [[list(labels), value] for labels, value in metric.samples()]
+            for metric in self.metrics
+        }
+
+    def merge(self, snapshots):
+        """
+        Sum of `snapshots`, by metric name and label values
+        """
+        merged = {metric.name: {} for metric in self.metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                if name not in merged:
+                    continue  # a worker running another version
+                values = merged[name]
+                for labels, value in samples:
+                    labels = tuple(labels)
+                    if isinstance(value, list):
+                        total = values.get(labels) or [0] * len(value)
+                        values[labels] = [a + b for a, b in zip(total, value)]
+                    else:
+                        values[labels] = values.get(labels, 0) + value
+        return merged
+
+    def render(self, merged=None):
+        merged = merged if merged is not None else self.merge([self.snapshot()])
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, value in sorted(merged[metric.name].items()):
+                pairs = [
+                    f'{name}="{escape(label)}"' for name, label in zip(metric.labelnames, labels)
+                ]
+                if metric.type != "histogram":
+                    lines.append(f"{metric.name}{format_labels(pairs)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ("+Inf",), value[:-1]):
+                    cumulative += count
+                    bucket_labels = format_labels(pairs + [f'le="{bound}"'])
+                    lines.append(f"{metric.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{metric.name}_sum{format_labels(pairs)} {value[-1]}")
+                lines.append(f"{metric.name}_count{format_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    async def render_cluster(self):
+        """
+        Prometheus text of the sum over every worker that pushed a snapshot lately
+        """
+        redis = get_redis()
+        await redis.hset(
+            self.prefix,
+            self.worker_id,
+            dumps({"time": time.time(), "metrics": self.snapshot()}),
+        )
+        entries = await redis.hgetall(self.prefix)
+        snapshots, stale = [], []
+        for worker, entry in entries.items():
+            entry = loads(entry)
+            if entry["time"] < time.time() - self.interval * 3:
+                stale.append(worker)
+            else:
+                snapshots.append(entry["metrics"])
+        if stale:
+            await redis.hdel(self.prefix, *stale)
+        return self.render(self.merge(snapshots))
+
+    async def publish(self):
+        while True:
+            try:
+                snapshot = dumps({"time": time.time(), "metrics": self.snapshot()})
+                await get_redis().hset(self.prefix, self.worker_id, snapshot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Metrics - {e}")
+            await asyncio.sleep(self.interval)
+
+    def ensure_publisher(self):
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            self._tasks[loop] = loop.create_task(self.publish())
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+metrics = MetricsRegistry(settings.WS_METRICS_INTERVAL)
+
+connects = metrics.counter("ws_connects_total", "WebSocket connections accepted", ["project"])
+rejects = metrics.counter(
+    "ws_rejects_total", "WebSocket handshakes refused, by reason", ["reason"]
+)
+messages_in = metrics.counter(
+    "ws_messages_in_total", "Messages received from clients", ["project"]
+)
+messages_out = metrics.counter(
+    "ws_messages_out_total", "Messages written to clients", ["project"]
+)
+send_failures = metrics.counter(
+    "ws_send_failures_total", "Channel layer sends that raised, by operation", ["operation"]
+)
+handshake_seconds = metrics.histogram(
+    "ws_handshake_seconds", "Time from the WebSocket handshake to accept"
+)
+layer_send_seconds = metrics.histogram(
+    "ws_layer_send_seconds", "Time of one channel layer send, by operation", ["operation"]
+)
+fanout = metrics.histogram(
+    "ws_fanout_channels",
+    "Channels one message is sent to, by operation",
+    ["operation"],
+    buckets=SIZE_BUCKETS,
+)
+redis_rtt_seconds = metrics.histogram(
+    "ws_redis_rtt_seconds", "Round trip of the presence heartbeat, by Redis shard", ["shard"]
+)
+
+
+_project_stats = [None, {}]  # snapshot number, registry.stats()["projects"]
+
+
+def project_stat(key):
+    """
+    Collect function of one value of registry.project_stats, by project.
+    Its gauges share one walk over the connections per snapshot.
+    """
+
+    def collect():
+        if _project_stats[0] != metrics.snapshots:
+            _project_stats[:] = [metrics.snapshots, registry.stats()["projects"]]
+        return {(project,): stats[key] for project, stats in _project_stats[1].items()}
+
+    return collect
+
+
+def reaped_connections():
+    return {
+        (project, reason): count
+        for project, counts in reaper.reaped.items()
+        for reason, count in counts.items()
+    }
+
+
+metrics.gauge(
+    "ws_connections",
+    "Open WebSocket connections, by project",
+    ["project"],
+    collect=lambda: {(project,): count for project, count in registry.counts().items()},
+)
+metrics.gauge(
+    "ws_send_queue_depth",
+    "Messages waiting in the send queues of the connections, by project",
+    ["project"],
+    collect=project_stat("queued"),
+)
+metrics.register(
+    CollectedCounter(
+        "ws_send_queue_dropped_total",
+        "Messages dropped by full send queues, by project",
+        ["project"],
+        collect=project_stat("dropped"),
+    )
+)
+metrics.gauge(
+    "ws_compression_bytes",
+    "Approximate memory of the +deflate contexts, by project",
+    ["project"],
+    collect=project_stat("compression_bytes"),
+)
+metrics.gauge(
+    "ws_registry_bytes",
+    "Approximate memory of the connection registry, by project",
+    ["project"],
+    collect=project_stat("bytes"),
+)
+metrics.register(
+    CollectedCounter(
+        "ws_reaped_total",
+        "Connections closed by the reaper, by project and reason",
+        ["project", "reason"],
+        collect=reaped_connections,
+    )
+)
+metrics.register(
+    CollectedCounter(
+        "ws_token_cache_total",
+        "Token cache lookups, by result",
+        ["result"],
+        collect=lambda: {
+            ("hit",): token_cache.stats()["hits"],
+            ("miss",): token_cache.stats()["misses"],
+        },
+    )
+)
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+
+class Outbox:
+    """
+    Bounded queue of the messages waiting to be written to one connection,
+    so that a slow client only ever slows itself down. It only fills up when
+    the server makes writes wait for the client (Uvicorn), Daphne buffers them.
+    When `max_size` messages are waiting, `overflow` decides: drop the oldest,
+    drop the newest, or disconnect (put returns False).
+    Batches are written once `window` seconds have passed since their first
+    message, or as soon as `max_messages` are waiting.
+    """
+
+    def __init__(self, write, max_size, overflow=DROP_OLDEST, window=0, max_messages=1):
+        self.write = write  # coroutine function taking a list of events
+        self.max_size = max_size
+        self.overflow = overflow
+        self.window = window
+        self.max_messages = max_messages
+        self.dropped = 0
+        self.closed = False
+        self._events = deque()
+        self._full = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def put(self, event):
+        """
+        Return False if the connection is too slow and must be closed
+        """
+        if self.closed:
+            return True
+        if len(self._events) >= self.max_size:
+            if self.overflow == DISCONNECT:
+                return False
+            self.dropped += 1
+            if self.overflow == DROP_NEWEST:
+                return True
+            self._events.popleft()
+
+        self._events.append(event)
+        if len(self._events) >= self.max_messages:
+            self._full.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    async def _run(self):
+        try:
+            while self._events:
+                if self.window and len(self._events) < self.max_messages:
+                    self._full.clear()
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                count = min(len(self._events), self.max_messages)
+                await self.write([self._events.popleft() for _ in range(count)])
+        finally:
+            self._task = None
+
+    def close(self):
+        self.closed = True
+        self._events.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self):
+        return {"depth": len(self._events), "dropped": self.dropped}
@@ -0,0 +1,323 @@
+from django.conf import settings
+
+from src.ws.connection import get_redis, get_sync_redis
+from src.ws.metrics import redis_rtt_seconds
+from src.ws.shards import redis_url
+
+import asyncio
+import logging
+import os
+import secrets
+import socket
+import time
+import weakref
+
+
+# KEYS: client hash, worker channels, project clients, project connections
+# ARGV: channel name, worker id, worker channels member, client id, "1" to count exactly
+REGISTER_SCRIPT = """
+if redis.call('HSET', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('INCR', KEYS[4])
+    if ARGV[5] == '1' then
+        redis.call('SADD', KEYS[3], ARGV[4])
+    end
+end
+redis.call('SADD', KEYS[2], ARGV[3])
+"""
+
+# KEYS: as REGISTER_SCRIPT
+# ARGV: channel name, worker channels member, client id
+UNREGISTER_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 1 then
+    if redis.call('DECR', KEYS[4]) <= 0 then
+        redis.call('DEL', KEYS[4])
+    end
+    if redis.call('HLEN', KEYS[1]) == 0 then
+        redis.call('SREM', KEYS[3], ARGV[3])
+    end
+end
+redis.call('SREM', KEYS[2], ARGV[2])
+"""
+
+
+class PresenceRegistry:
+    """
+    Cluster-wide map of client_id -> channel names, kept in Redis:
+        <prefix>:client:<client_id>         hash of channel name -> worker id
+        <prefix>:worker:<worker_id>         heartbeat, expires when the worker dies
+        <prefix>:worker:<worker_id>:channels  "<channel name> <project> <client_id>"
+        <prefix>:workers                    ids of every worker that registered channels
+        <prefix>:project:<project>:connections  number of connections
+        <prefix>:project:<project>:clients      client ids, projects counted exactly
+        <prefix>:project:<project>:hll:<n>      HyperLogLog of the client ids seen during
+                                                heartbeat interval n, projects counted
+                                                approximately
+    Every worker sweeps the channels of dead workers out of the client hashes.
+    The keys of a project, and the worker keys of its channels, are on the Redis
+    shard of the project: every shard is swept on its own.
+    Lookups go through a short-lived local cache, empty results are never cached
+    so that a client that just came online is found immediately.
+    """
+
+    prefix = "ws-service:presence"
+
+    def __init__(self, heartbeat_interval, worker_ttl, cache_ttl):
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_ttl = worker_ttl
+        self.cache_ttl = cache_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._cache = {}  # client_id -> (expires_at, channel names)
+        self._local = {}  # channel name -> (client_id, project, exact) of this worker
+        self._heartbeats = {}  # event loop -> heartbeat task
+        self._scripts = weakref.WeakKeyDictionary()  # Redis client -> name -> script
+
+    def _client_key(self, client_id):
+        return f"{self.prefix}:client:{client_id}"
+
+    def _worker_key(self, worker_id):
+        return f"{self.prefix}:worker:{worker_id}"
+
+    def _channels_key(self, worker_id):
+        return f"{self.prefix}:worker:{worker_id}:channels"
+
+    def _project_key(self, project, name):
+        return f"{self.prefix}:project:{project}:{name}"
+
+    def _hll_keys(self, project):
+        """
+        HyperLogLogs of the current and of the previous heartbeat interval
+        """
+        interval = int(time.time() // self.heartbeat_interval)
+        return [self._project_key(project, f"hll:{n}") for n in (interval, interval - 1)]
+
+    def _keys(self, worker_id, client_id, project):
+        return [
+            self._client_key(client_id),
+            self._channels_key(worker_id),
+            self._project_key(project, "clients"),
+            self._project_key(project, "connections"),
+        ]
+
+    def _script(self, redis, name):
+        scripts = self._scripts.setdefault(redis, {})
+        script = scripts.get(name)
+        if script is None:
+            source = REGISTER_SCRIPT if name == "register" else UNREGISTER_SCRIPT
+            script = scripts[name] = redis.register_script(source)
+        return script
+
+    async def _add(self, redis, pipe, channel_name, client_id, project, exact):
+        await self._script(redis, "register")(
+            keys=self._keys(self.worker_id, client_id, project),
+            args=[
+                channel_name,
+                self.worker_id,
+                f"{channel_name} {project} {client_id}",
+                client_id,
+                "1" if exact else "0",
+            ],
+            client=pipe,
+        )
+        if not exact:
+            hll_key = self._hll_keys(project)[0]
+            pipe.pfadd(hll_key, client_id)
+            pipe.expire(hll_key, self.heartbeat_interval * 3)
+
+    async def _remove(self, redis, pipe, worker_id, channel_name, client_id, project):
+        await self._script(redis, "unregister")(
+            keys=self._keys(worker_id, client_id, project),
+            args=[channel_name, f"{channel_name} {project} {client_id}", client_id],
+            client=pipe,
+        )
+
+    async def register(self, client_id, channel_name, project, exact=True):
+        """
+        `exact`: count the clients of `project` with a set rather than a HyperLogLog
+        """
+        self.ensure_heartbeat()
+        self._cache.pop(client_id, None)
+        self._local[channel_name] = (client_id, project, exact)
+        redis = get_redis(redis_url(project))
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._worker_key(self.worker_id), 1, ex=self.worker_ttl)
+            pipe.sadd(f"{self.prefix}:workers", self.worker_id)
+            await self._add(redis, pipe, channel_name, client_id, project, exact)
+            await pipe.execute()
+
+    async def unregister(self, client_id, channel_name, project):
+        self._cache.pop(client_id, None)
+        self._local.pop(channel_name, None)
+        redis = get_redis(redis_url(project))
+        async with redis.pipeline(transaction=False) as pipe:
+            await self._remove(redis, pipe, self.worker_id, channel_name, client_id, project)
+            await pipe.execute()
+
+    async def resolve(self, client_id, url=None):
+        """
+        Return the channel names of `client_id` on every worker,
+        `url` is the Redis shard of its project
+        """
+        entry = self._cache.get(client_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        channel_names = await get_redis(url).hkeys(self._client_key(client_id))
+        channel_names = [name.decode("utf-8") for name in channel_names]
+        if channel_names:
+            self._cache[client_id] = (now + self.cache_ttl, channel_names)
+        else:
+            self._cache.pop(client_id, None)
+        return channel_names
+
+    async def resolve_many(self, client_ids, url=None):
+        """
+        Return {client_id: channel names} of every client id, in one round trip,
+        `url` is the Redis shard of their project
+        """
+        now = time.monotonic()
+        resolved, missing = {}, []
+        for client_id in dict.fromkeys(client_ids):
+            entry = self._cache.get(client_id)
+            if entry is not None and entry[0] > now:
+                resolved[client_id] = entry[1]
+            else:
+                missing.append(client_id)
+        if not missing:
+            return resolved
+
+        async with get_redis(url).pipeline(transaction=False) as pipe:
+            for client_id in missing:
+                pipe.hkeys(self._client_key(client_id))
+            results = await pipe.execute()
+        for client_id, channel_names in zip(missing, results):
+            channel_names = [name.decode("utf-8") for name in channel_names]
+            if channel_names:
+                self._cache[client_id] = (now + self.cache_ttl, channel_names)
+            resolved[client_id] = channel_names
+        return resolved
+
+    async def sweep(self, url):
+        """
+        Remove the channels of workers whose heartbeat has expired on shard `url`
+        """
+        redis = get_redis(url)
+        workers = await redis.smembers(f"{self.prefix}:workers")
+        workers = [worker.decode("utf-8") for worker in workers]
+        if not workers:
+            return
+        alive = await redis.mget([self._worker_key(worker) for worker in workers])
+        for worker, heartbeat in zip(workers, alive):
+            if heartbeat is not None:
+                continue
+            channels_key = self._channels_key(worker)
+            members = await redis.smembers(channels_key)
+            async with redis.pipeline(transaction=False) as pipe:
+                for member in members:
+                    channel_name, project, client_id = member.decode("utf-8").split(" ", 2)
+                    await self._remove(redis, pipe, worker, channel_name, client_id, project)
+                pipe.delete(channels_key)
+                pipe.srem(f"{self.prefix}:workers", worker)
+                await pipe.execute()
+            logging.info(f"Presence - Worker: {worker} - Removed {len(members)} dead channels")
+
+    async def restore(self, url):
+        redis = get_redis(url)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(f"{self.prefix}:workers", self.worker_id)
+            for channel_name, (client_id, project, exact) in self._local.items():
+                if redis_url(project) == url:
+                    await self._add(redis, pipe, channel_name, client_id, project, exact)
+            await pipe.execute()
+
+    async def count_approximately(self):
+        """
+        Add the local clients of approximately counted projects to the
+        HyperLogLog of the current heartbeat interval
+        """
+        projects = {}
+        for client_id, project, exact in self._local.values():
+            if not exact:
+                projects.setdefault(project, set()).add(client_id)
+        shards = {}
+        for project, client_ids in projects.items():
+            shards.setdefault(redis_url(project), []).append((project, client_ids))
+        for url, projects in shards.items():
+            async with get_redis(url).pipeline(transaction=False) as pipe:
+                for project, client_ids in projects:
+                    hll_key = self._hll_keys(project)[0]
+                    pipe.pfadd(hll_key, *client_ids)
+                    pipe.expire(hll_key, self.heartbeat_interval * 3)
+                await pipe.execute()
+
+    def count(self, project, exact=True):
+        """
+        Connections and unique clients of `project`, from any thread.
+        Approximate counts are the clients seen during the last two heartbeat
+        intervals, with the 0.81% standard error of Redis HyperLogLogs.
+        """
+        with get_sync_redis(redis_url(project)).pipeline(transaction=False) as pipe:
+            pipe.get(self._project_key(project, "connections"))
+            if exact:
+                pipe.scard(self._project_key(project, "clients"))
+            else:
+                pipe.pfcount(*self._hll_keys(project))
+            connections, clients = pipe.execute()
+        return {
+            "connections": int(connections or 0),
+            "clients": clients,
+            "approximate": not exact,
+        }
+
+    def connection_count(self, client_id, project):
+        """
+        Connections of `client_id` on every worker, from any thread
+        """
+        return get_sync_redis(redis_url(project)).hlen(self._client_key(client_id))
+
+    def scan_clients(self, project, cursor=0, count=1000):
+        """
+        Return (next cursor, about `count` client ids) of an exactly counted
+        project, from any thread. The scan is over once the cursor is 0 again.
+        """
+        cursor, client_ids = get_sync_redis(redis_url(project)).sscan(
+            self._project_key(project, "clients"), cursor, count=count
+        )
+        return cursor, [client_id.decode("utf-8") for client_id in client_ids]
+
+    async def heartbeat(self):
+        while True:
+            try:
+                for index, url in enumerate(settings.WS_REDIS_SHARDS):
+                    started = time.perf_counter()
+                    alive = await get_redis(url).set(
+                        self._worker_key(self.worker_id), 1, ex=self.worker_ttl, get=True
+                    )
+                    redis_rtt_seconds.observe(time.perf_counter() - started, f"shard{index}")
+                    if alive is None and self._local:
+                        # missed our own heartbeat (e.g. a long pause), somebody swept us
+                        await self.restore(url)
+                    await self.sweep(url)
+                await self.count_approximately()
+                # drop expired lookups so the cache cannot outgrow the set of live clients
+                now = time.monotonic()
+                for client_id in [key for key, entry in self._cache.items() if entry[0] <= now]:
+                    del self._cache[client_id]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Presence heartbeat - {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def ensure_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        task = self._heartbeats.get(loop)
+        if task is None or task.done():
+            self._heartbeats[loop] = loop.create_task(self.heartbeat())
+
+
+presence = PresenceRegistry(
+    settings.WS_PRESENCE_HEARTBEAT_INTERVAL,
+    settings.WS_PRESENCE_WORKER_TTL,
+    settings.WS_PRESENCE_CACHE_TTL,
+)
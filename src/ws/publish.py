@@ -0,0 +1,109 @@
+from src.ws.codecs import dumps
+from src.ws.mailbox import mailbox
+from src.ws.metrics import send_failures
+from src.ws.replay import replay
+from src.ws.topics import topic_group
+from src.ws.tracing import marked, tracer
+
+
+def message_event(payload, group=None):
+    """
+    Channel layer event of a message, encoded to JSON once for every recipient.
+    Messages kept for replay carry their group so that receivers can skip
+    the ones they already got replayed.
+    """
+    event = {"type": "send_message", "text": dumps(payload)}
+    if group is not None and "id" in payload:
+        event["group"] = group
+        event["id"] = payload["id"]
+    return event
+
+
+def message_target(project, receivers=None, topic=None):
+    """
+    Return (group, client_ids) of a message to `receivers` or `topic` of `project`,
+    client_ids is None unless the message is addressed to client ids
+    """
+    if receivers is not None:
+        # replayed from the project's stream, to these clients only
+        return project, [f"{project}_{id}" for id in receivers]
+    if topic is not None:
+        return topic_group(project, topic), None
+    return project, None
+
+
+async def publish(
+    channel_layer,
+    project,
+    payload,
+    receivers=None,
+    topic=None,
+    exclude=None,
+    ws_settings=None,
+    trace=None,
+):
+    """
+    Send `payload` through `channel_layer`, the layer of the project's shard,
+    to every client of `project`, to the client ids in `receivers`
+    or to the subscribers of `topic`.
+    `exclude` is a channel name that must not get it (the sender's).
+    With the project's `ws_settings`, the message is kept for replay and gets an "id",
+    and receivers that are offline find it in their mailbox.
+    A sampled message carries its `trace` to the recipients.
+    """
+    group, client_ids = message_target(project, receivers, topic)
+    if ws_settings is not None:
+        stream_id = await replay.append(group, payload, ws_settings, client_ids)
+        if stream_id is not None:
+            payload = {**payload, "id": stream_id}
+    event = message_event(payload, group)
+    if trace is not None:
+        event["trace"] = marked(trace, "published")
+
+    try:
+        if client_ids is not None:
+            offline = await channel_layer.send_to_clients(client_ids, event, exclude=exclude)
+            if offline and ws_settings is not None:
+                await mailbox.store(project, offline, event, ws_settings)
+        else:
+            await channel_layer.group_send(group, event, exclude=exclude)
+    except Exception:
+        send_failures.inc("send_to_clients" if client_ids is not None else "group_send")
+        raise
+
+
+async def publish_many(channel_layer, project, messages, ws_settings=None):
+    """
+    Publish (payload, receivers, topic) `messages` in their order: their replay
+    entries, their deliveries and their mailbox entries each take one pipeline,
+    and every recipient gets them in order (only those with the same target
+    with the pub/sub layer, where group messages take another path)
+    """
+    targets = [message_target(project, receivers, topic) for _, receivers, topic in messages]
+    payloads = [payload for payload, _, _ in messages]
+    if ws_settings is not None:
+        entries = [(group, payload, ids) for payload, (group, ids) in zip(payloads, targets)]
+        stream_ids = await replay.append_many(entries, ws_settings)
+        payloads = [
+            payload if stream_id is None else {**payload, "id": stream_id}
+            for payload, stream_id in zip(payloads, stream_ids)
+        ]
+    deliveries = []
+    for payload, (group, client_ids) in zip(payloads, targets):
+        event = message_event(payload, group)
+        trace = tracer.start(project)
+        if trace is not None:
+            event["trace"] = marked(trace, "published")
+        deliveries.append((group, client_ids, event))
+
+    try:
+        offline = await channel_layer.send_in_order(deliveries)
+    except Exception:
+        send_failures.inc("send_in_order")
+        raise
+    if ws_settings is not None:
+        await mailbox.store_many(
+            project,
+            [(ids, event) for ids, (_, _, event) in zip(offline, deliveries) if ids],
+            ws_settings,
+        )
@@ -0,0 +1,84 @@
+from django.conf import settings
+
+from src.ws.connection import get_redis
+from src.ws.shards import redis_url
+
+import logging
+import weakref
+
+
+# Takes one token from every bucket in KEYS or from none of them.
+# ARGV holds a (rate, burst) pair per key, the clock is the Redis server's
+# so that all workers agree on it.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    available = math.min(burst, available + elapsed * rate)
+    if available < 1 then
+        return 0
+    end
+    tokens[i] = available
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return 1
+"""
+
+
+class ConnectionRateLimiter:
+    """
+    Token buckets of connection attempts kept in Redis, per IP and per project
+    """
+
+    prefix = "ws-service:ratelimit"
+
+    def __init__(self, ip_rate, ip_burst):
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self._scripts = weakref.WeakKeyDictionary()  # Redis client -> registered script
+
+    async def _take(self, buckets, url=None):
+        buckets = [(key, rate, burst) for key, rate, burst in buckets if rate]
+        if not buckets:
+            return True
+        args = []
+        for _, rate, burst in buckets:
+            args += [rate, max(1, burst)]
+        try:
+            redis = get_redis(url)
+            script = self._scripts.get(redis)
+            if script is None:
+                script = self._scripts[redis] = redis.register_script(TOKEN_BUCKET_SCRIPT)
+            return bool(await script(keys=[key for key, _, _ in buckets], args=args))
+        except Exception as e:
+            logging.error(f"Rate limiter - {e}")
+            return True  # a Redis hiccup must not lock everybody out
+
+    async def allow_ip(self, ip):
+        return await self._take([(f"{self.prefix}:ip:{ip}", self.ip_rate, self.ip_burst)])
+
+    async def allow_project(self, project, ws_settings):
+        return await self._take(
+            [
+                (
+                    f"{self.prefix}:project:{project}",
+                    ws_settings["connect_rate"],
+                    ws_settings["connect_burst"],
+                )
+            ],
+            redis_url(project),
+        )
+
+
+rate_limiter = ConnectionRateLimiter(settings.WS_IP_CONNECT_RATE, settings.WS_IP_CONNECT_BURST)
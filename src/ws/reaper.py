@@ -0,0 +1,106 @@
+from django.conf import settings
+
+from src.ws.codes import HEARTBEAT_TIMEOUT, IDLE_TIMEOUT
+from src.ws.connection import get_redis, get_sync_redis
+from src.ws.registry import registry
+from src.ws.shards import redis_url
+
+import asyncio
+import logging
+import time
+
+
+class Reaper:
+    """
+    Pings the connections of this process every `heartbeat_interval` seconds of
+    their project, and closes the ones that left `heartbeat_max_missed` pings in
+    a row unanswered, or sent nothing but pongs for `idle_timeout` seconds.
+    Half-open connections (e.g. a phone that lost its network) are only found so.
+    One sweep every `interval` seconds walks the registry, whatever the number
+    of connections. Counts of every worker add up in Redis:
+        <prefix>:<project>    hash of reason -> connections closed, on the project's shard
+    """
+
+    prefix = "ws-service:reaped"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.reaped = {}  # project -> reason -> connections closed
+        self._tasks = {}  # event loop -> sweeper task
+
+    async def sweep(self):
+        now = time.monotonic()
+        reaped = []
+        for consumer in registry.connections():
+            ws_settings = consumer.ws_settings
+            idle_timeout = ws_settings["idle_timeout"]
+            heartbeat_interval = ws_settings["heartbeat_interval"] if consumer.heartbeat else 0
+            if idle_timeout and now - consumer.last_active > idle_timeout:
+                reaped.append((consumer, "idle", IDLE_TIMEOUT))
+            elif heartbeat_interval and now - consumer.last_ping >= heartbeat_interval:
+                if consumer.missed_pings >= ws_settings["heartbeat_max_missed"]:
+                    reaped.append((consumer, "heartbeat", HEARTBEAT_TIMEOUT))
+                    continue
+                consumer.missed_pings += 1
+                consumer.last_ping = now
+                await consumer.send_control({"action": "ping"})
+
+        if not reaped:
+            return
+        # kick runs the normal disconnect cleanup
+        results = await asyncio.gather(
+            *[consumer.kick(code) for consumer, _, code in reaped], return_exceptions=True
+        )
+        for (consumer, reason, _), result in zip(reaped, results):
+            if isinstance(result, Exception):
+                logging.error(f"Client: {consumer.client_id} - Reaping failed - {result}")
+        logging.info(f"Reaper - Closed {len(reaped)} dead or idle connections")
+
+        shards = {}
+        for consumer, reason, _ in reaped:
+            counts = self.reaped.setdefault(consumer.project, {})
+            counts[reason] = counts.get(reason, 0) + 1
+            shards.setdefault(redis_url(consumer.project), []).append((consumer.project, reason))
+        for url, increments in shards.items():
+            async with get_redis(url).pipeline(transaction=False) as pipe:
+                for project, reason in increments:
+                    pipe.hincrby(f"{self.prefix}:{project}", reason, 1)
+                await pipe.execute()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Reaper - {e}")
+
+    def ensure_running(self):
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            self._tasks[loop] = loop.create_task(self.run())
+
+    def stats(self):
+        """
+        Connections closed by this process since it started, per project and reason
+        """
+        totals = {"heartbeat": 0, "idle": 0}
+        for counts in self.reaped.values():
+            for reason, count in counts.items():
+                totals[reason] += count
+        return {**totals, "projects": self.reaped}
+
+    def totals(self, project):
+        """
+        Connections of `project` closed by every worker, from any thread
+        """
+        counts = get_sync_redis(redis_url(project)).hgetall(f"{self.prefix}:{project}")
+        totals = {"heartbeat": 0, "idle": 0}
+        totals.update({reason.decode("utf-8"): int(count) for reason, count in counts.items()})
+        return totals
+
+
+reaper = Reaper(settings.WS_REAPER_INTERVAL)
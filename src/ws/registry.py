@@ -0,0 +1,110 @@
+import sys
+
+
+class ConnectionRegistry:
+    """
+    Connections accepted by this process, indexed by channel name and by
+    project -> client_id -> channel names.
+    Entries are removed as soon as they are empty so that a client id never
+    outlives its last connection.
+    """
+
+    def __init__(self):
+        self._connections = {}  # channel name -> consumer
+        self._projects = {}  # project -> client_id -> set of channel names
+        self._dropped = {}  # project -> messages dropped by the closed connections
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __contains__(self, channel_name):
+        return channel_name in self._connections
+
+    def add(self, consumer):
+        self._connections[consumer.channel_name] = consumer
+        clients = self._projects.setdefault(consumer.project, {})
+        clients.setdefault(consumer.client_id, set()).add(consumer.channel_name)
+
+    def remove(self, consumer):
+        """
+        Return False if `consumer` was not registered (or already removed)
+        """
+        if self._connections.pop(consumer.channel_name, None) is None:
+            return False
+        if consumer.outbox.dropped:
+            dropped = self._dropped.get(consumer.project, 0)
+            self._dropped[consumer.project] = dropped + consumer.outbox.dropped
+        clients = self._projects[consumer.project]
+        channel_names = clients[consumer.client_id]
+        channel_names.discard(consumer.channel_name)
+        if not channel_names:
+            del clients[consumer.client_id]
+            if not clients:
+                del self._projects[consumer.project]
+        return True
+
+    def get(self, channel_name):
+        return self._connections.get(channel_name)
+
+    def connections(self, project=None):
+        if project is None:
+            return list(self._connections.values())
+        return [
+            self._connections[channel_name]
+            for channel_names in self._projects.get(project, {}).values()
+            for channel_name in channel_names
+        ]
+
+    def channel_names(self, client_id, project):
+        return set(self._projects.get(project, {}).get(client_id, ()))
+
+    def counts(self):
+        """
+        Number of connections of every project
+        """
+        return {
+            project: sum(len(channel_names) for channel_names in clients.values())
+            for project, clients in self._projects.items()
+        }
+
+    def project_stats(self, project):
+        clients = self._projects.get(project, {})
+        size = sys.getsizeof(clients)
+        connections = 0
+        for client_id, channel_names in clients.items():
+            connections += len(channel_names)
+            size += sys.getsizeof(client_id) + sys.getsizeof(channel_names)
+            size += sum(sys.getsizeof(channel_name) for channel_name in channel_names)
+        # every connection is also indexed by channel name
+        index_size = sys.getsizeof(self._connections) // max(1, len(self._connections))
+        size += connections * index_size
+        compression = queued = 0
+        dropped = self._dropped.get(project, 0)
+        for consumer in self.connections(project):
+            if consumer.compressor is not None:
+                compression += consumer.compressor.memory()
+            send_queue = consumer.stats()["send_queue"]
+            queued += send_queue["depth"]
+            dropped += send_queue["dropped"]
+        return {
+            "connections": connections,
+            "clients": len(clients),
+            "bytes": size,
+            "compression_bytes": compression,
+            "queued": queued,
+            "dropped": dropped,
+        }
+
+    def stats(self):
+        """
+        Live counts and approximate memory of the registry, per project,
+        and the messages dropped since the process started
+        """
+        projects = self._projects.keys() | self._dropped.keys()
+        return {
+            "connections": len(self._connections),
+            "projects": {project: self.project_stats(project) for project in projects},
+        }
+
+
+registry = ConnectionRegistry()
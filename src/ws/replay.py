@@ -0,0 +1,98 @@
+from src.ws.codecs import dumps, loads
+from src.ws.connection import get_redis
+from src.ws.shards import group_project, redis_url
+
+import logging
+import re
+import time
+
+
+STREAM_ID_PATTERN = re.compile(r"^\d{1,20}-\d{1,20}$")
+
+
+def parse_stream_id(stream_id):
+    """
+    Return a stream id ("<ms>-<seq>") as a comparable tuple, None if it is not one
+    """
+    if not isinstance(stream_id, str) or not STREAM_ID_PATTERN.match(stream_id):
+        return None
+    ms, seq = stream_id.split("-")
+    return int(ms), int(seq)
+
+
+class ReplayBuffer:
+    """
+    Recent messages of every channel layer group (a project or one of its topics),
+    kept in a capped Redis Stream:
+        <prefix>:<group>    entries {"payload": JSON, "to": JSON list of client ids}
+    The entry id is the id clients resume from. Streams are trimmed to
+    `replay_max_len` entries and `replay_max_age` seconds, and expire once idle.
+    They are on the Redis shard of their project.
+    """
+
+    prefix = "ws-service:replay"
+
+    def _key(self, group):
+        return f"{self.prefix}:{group}"
+
+    async def append(self, group, payload, ws_settings, client_ids=None):
+        """
+        Return the id of the new entry, None if replay is disabled or Redis failed
+        """
+        return (await self.append_many([(group, payload, client_ids)], ws_settings))[0]
+
+    async def append_many(self, entries, ws_settings):
+        """
+        Append the (group, payload, client_ids) `entries` of one project in their order,
+        with one round trip. Return the id of every new entry, as append does.
+        """
+        max_len, max_age = ws_settings["replay_max_len"], ws_settings["replay_max_age"]
+        if not max_len or not max_age or not entries:
+            return [None] * len(entries)
+        min_id = int((time.time() - max_age) * 1000)
+        try:
+            async with get_redis(redis_url(group_project(entries[0][0]))).pipeline(
+                transaction=False
+            ) as pipe:
+                for group, payload, client_ids in entries:
+                    key = self._key(group)
+                    fields = {"payload": dumps(payload)}
+                    if client_ids is not None:
+                        fields["to"] = dumps(client_ids)
+                    pipe.xadd(key, fields, maxlen=max_len, approximate=True)
+                    pipe.xtrim(key, minid=min_id, approximate=True)
+                    pipe.expire(key, int(max_age) + 1)
+                results = await pipe.execute()
+        except Exception as e:
+            groups = ", ".join(dict.fromkeys(group for group, _, _ in entries))
+            logging.error(f"Replay - Group: {groups} - {e}")
+            return [None] * len(entries)
+        return [stream_id.decode("utf-8") for stream_id in results[::3]]
+
+    async def read(self, group, last_id, client_id, count):
+        """
+        Return (entries after `last_id` that `client_id` may see, complete) where
+        `complete` is False when entries after `last_id` may have been trimmed
+        """
+        key = self._key(group)
+        async with get_redis(redis_url(group_project(group))).pipeline(
+            transaction=False
+        ) as pipe:
+            pipe.xrange(key, "-", "+", count=1)
+            pipe.xrange(key, f"({last_id}", "+", count=count)
+            oldest, entries = await pipe.execute()
+        complete = bool(oldest) and parse_stream_id(oldest[0][0].decode("utf-8")) <= (
+            parse_stream_id(last_id)
+        )
+        payloads = []
+        for stream_id, fields in entries:
+            to = fields.get(b"to")
+            if to is not None and client_id not in loads(to):
+                continue
+            payload = loads(fields[b"payload"])
+            payload["id"] = stream_id.decode("utf-8")
+            payloads.append(payload)
+        return payloads, complete
+
+
+replay = ReplayBuffer()
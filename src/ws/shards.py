@@ -0,0 +1,38 @@
+from django.conf import settings
+
+import functools
+import hashlib
+
+
+def _score(url, project):
+    digest = hashlib.blake2b(f"{url}\n{project}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def pick_shard(project, urls):
+    """
+    Rendezvous hashing: the URL scoring highest for `project` wins, so adding a
+    shard only moves the projects it now wins (about 1 / number of shards of them)
+    """
+    return max(range(len(urls)), key=lambda index: _score(urls[index], project))
+
+
+@functools.lru_cache(maxsize=settings.WS_PROJECT_CACHE_SIZE)
+def shard_index(project):
+    return pick_shard(project, settings.WS_REDIS_SHARDS)
+
+
+def redis_url(project):
+    """
+    URL of the Redis instance holding the groups, presence and messages of `project`
+    """
+    return settings.WS_REDIS_SHARDS[shard_index(project)]
+
+
+def channel_layer_alias(project):
+    return f"shard{shard_index(project)}"
+
+
+def group_project(group):
+    # groups are "<project>" or "<project>.topic.<topic>", project names have no dot
+    return group.split(".", 1)[0]
@@ -0,0 +1,70 @@
+from django.conf import settings
+
+import hashlib
+import time
+from collections import OrderedDict
+import jwt
+
+
+class TokenCache:
+    """
+    LRU of verified JWT payloads keyed by sha256(project, secret key, token).
+    A payload is served until the token's `exp`, repeat handshakes with the
+    same token skip the HMAC verification and JSON parsing.
+    The returned payloads are shared, do not modify them.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # digest -> (project, expires_at or None, payload)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def decode(self, project, secret_key, token):
+        digest = hashlib.sha256(
+            b"\0".join((project.encode(), secret_key.encode(), token.encode()))
+        ).digest()
+        now = time.time()
+
+        entry = self._entries.get(digest)
+        if entry is not None:
+            if entry[1] is None or entry[1] > now:
+                self.hits += 1
+                self._entries.move_to_end(digest)
+                return entry[2]
+            del self._entries[digest]
+
+        self.misses += 1
+        payload = jwt.decode(token, secret_key, algorithms=["HS256"])
+        expires_at = payload.get("exp")
+        if expires_at is None or expires_at > now:
+            self._entries[digest] = (project, expires_at, payload)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, project):
+        """
+        Drop the payloads of `project`, e.g. after its secret key was rotated
+        """
+        for digest in [key for key, entry in self._entries.items() if entry[0] == project]:
+            del self._entries[digest]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache(settings.WS_TOKEN_CACHE_SIZE)
@@ -0,0 +1,17 @@
+import re
+
+
+# Channel layer group names are limited to 100 characters of [a-zA-Z0-9-_.]
+TOPIC_PATTERN = re.compile(r"^[a-zA-Z0-9-_.]{1,50}$")
+
+
+def validate_topic(topic) -> tuple[str, str]:
+    if isinstance(topic, str) and TOPIC_PATTERN.match(topic):
+        return topic, None
+    else:
+        return topic, "1-50 letters, digits, hyphens, underscores or dots"
+
+
+def topic_group(project, topic):
+    # project names have no dot, a topic group cannot be another project's group
+    return f"{project}.topic.{topic}"
@@ -0,0 +1,104 @@
+from django.conf import settings
+
+from src.ws.codecs import dumps, loads
+from src.ws.connection import get_redis
+from src.ws.metrics import metrics
+
+import asyncio
+from collections import deque
+import logging
+import os
+import random
+import time
+
+
+stage_seconds = metrics.histogram(
+    "ws_trace_stage_seconds",
+    "Latency of the sampled messages, by stage (time since the previous stage)",
+    ["stage"],
+)
+
+
+def marked(trace, stage, at=None):
+    """
+    Copy of `trace` that reached `stage` at `at` (now by default).
+    Traces travel in channel layer events shared by every local recipient,
+    they are never changed in place.
+    """
+    return {**trace, "stages": trace["stages"] + [[stage, at or time.time()]]}
+
+
+class Tracer:
+    """
+    Samples `sample_rate` of the published messages. A sampled message carries
+    its trace in its channel layer event:
+        {"id": ..., "project": ..., "stages": [[stage, time], ...]}
+    with the wall clock times at which it was received, parsed, published,
+    delivered to the recipient's consumer, dequeued from its send queue and
+    written. Every recipient records the stages in histograms, and the traces
+    that took more than `slow_threshold` seconds are kept in Redis:
+        <prefix>    list of the last `max_slow` slow traces, newest first
+    With a `sample_rate` of 0 nothing is sampled and start is a single check.
+    """
+
+    prefix = "ws-service:traces"
+
+    def __init__(self, sample_rate, slow_threshold, max_slow):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.max_slow = max_slow
+        self.sampled = 0
+        self._slow = deque(maxlen=max_slow)  # waiting to be pushed to Redis
+        self._task = None
+
+    def start(self, project):
+        """
+        Return a new trace, None if the message is not sampled
+        """
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return {
+            "id": os.urandom(8).hex(),
+            "project": project,
+            "stages": [["received", time.time()]],
+        }
+
+    def finish(self, trace):
+        stages = trace["stages"]
+        for (_, previous), (stage, at) in zip(stages, stages[1:]):
+            # the stages may be timed by different hosts, whose clocks drift
+            stage_seconds.observe(max(0, at - previous), stage)
+        total = stages[-1][1] - stages[0][1]
+        stage_seconds.observe(max(0, total), "total")
+        if total < self.slow_threshold:
+            return
+        self._slow.append({**trace, "total": total})
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._push())
+
+    async def _push(self):
+        try:
+            while self._slow:
+                traces = [dumps(self._slow.popleft()) for _ in range(len(self._slow))]
+                try:
+                    async with get_redis().pipeline(transaction=False) as pipe:
+                        pipe.lpush(self.prefix, *traces)
+                        pipe.ltrim(self.prefix, 0, self.max_slow - 1)
+                        await pipe.execute()
+                except Exception as e:
+                    logging.error(f"Tracing - {e}")
+        finally:
+            self._task = None
+
+    async def slow(self, count=None):
+        """
+        Last slow traces of every worker, newest first
+        """
+        count = min(count or self.max_slow, self.max_slow)
+        return [loads(trace) for trace in await get_redis().lrange(self.prefix, 0, count - 1)]
+
+
+tracer = Tracer(
+    settings.WS_TRACE_SAMPLE_RATE, settings.WS_TRACE_SLOW_THRESHOLD, settings.WS_TRACE_MAX_SLOW
+)
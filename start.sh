@@ -2,5 +2,22 @@
 # Start Gunicorn processes
 # gunicorn -c gunicorn.py
 gunicorn --reload -w 5 src.wsgi:application -b 0.0.0.0:8000 --daemon
-# Start Daphne processes
-daphne src.asgi:application -p 8001 --proxy-headers > /dev/null 2>&1
+# Start the ASGI workers, one Uvicorn process per CPU core on port 8001, on uvloop
+# (ASGI_SERVER=daphne runs Daphne instead, without send queue backpressure)
+python manage.py runworkers --server "${ASGI_SERVER:-uvicorn}" --port 8001 --proxy-headers \
+    > /dev/null 2>&1 &
+ASGI_PID=$!
+
+# WS_DRAIN_DURATION as the workers read it: the environment first, then .env
+DRAIN_DURATION=$(python manage.py shell -c \
+    "from django.conf import settings; print(settings.WS_DRAIN_DURATION)" 2> /dev/null)
+
+# On stop, drain the WebSocket connections (SIGUSR1) before the workers exit
+drain() {
+    kill -USR1 "$ASGI_PID"
+    sleep "${DRAIN_DURATION:-60}"
+    kill -TERM "$ASGI_PID"
+}
+trap drain TERM INT
+wait "$ASGI_PID"
+wait "$ASGI_PID"